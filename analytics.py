@@ -0,0 +1,202 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+STATUS_CODES = {"BACKLOG": 0, "TODO": 1, "DOING": 2, "DONE": 3, "ARCHIVED": 4}
+STATUS_PREFIX = "Changed status to "
+
+SECONDS_PER_HOUR = 3600.0
+SECONDS_PER_WEEK = 7 * 86400
+# 1970-01-01 was a Thursday; weeks are counted from the following Monday.
+MONDAY_OFFSET = 4 * 86400
+
+# Below this many status changes (or on a single core) the pool costs more than it saves.
+POOL_MIN_EVENTS = 200000
+PERCENTILES = (50, 85, 95)
+
+
+def status_events(entries):
+    # Keeps only the (action, timestamp) pairs of status changes ("Changed status to DONE"),
+    # so little has to be shipped to pool workers.
+    return [(entry["action"], entry["timestamp"]) for entry in entries
+            if entry["action"].startswith(STATUS_PREFIX)]
+
+
+def extract_transitions(events):
+    # Turns each task's (action, timestamp) list into columnar arrays of status changes.
+    # This is the only pass over the free-text actions; everything after it is vectorized.
+    event_task, event_status, event_time = [], [], []
+    for position, task_events in enumerate(events):
+        for action, timestamp in task_events:
+            code = STATUS_CODES.get(action[len(STATUS_PREFIX):])
+            if code is not None:
+                event_task.append(position)
+                event_status.append(code)
+                event_time.append(timestamp)
+
+    # Timestamps are naive local times; keep them that way so weeks match what users see.
+    seconds = np.array(event_time, dtype="datetime64[us]").astype(np.int64) / 1e6
+    return (np.array(event_task, dtype=np.int64), np.array(event_status, dtype=np.int8),
+            seconds.astype(np.float64))
+
+
+def task_milestones(event_task, event_status, event_time, task_count):
+    # First time each task reached TODO, DOING and DONE (NaN when it never did).
+    milestones = {}
+    for name in ("TODO", "DOING", "DONE"):
+        reached = np.full(task_count, np.nan)
+        mask = event_status == STATUS_CODES[name]
+        np.fmin.at(reached, event_task[mask], event_time[mask])
+        milestones[name] = reached
+    return milestones
+
+
+def durations(start, end):
+    # Hours between two milestone arrays; NaN where either is missing or the order is reversed.
+    hours = (end - start) / SECONDS_PER_HOUR
+    return np.where(hours >= 0, hours, np.nan)
+
+
+def summarize(hours):
+    values = hours[~np.isnan(hours)]
+    if values.size == 0:
+        return {"count": 0, "mean": None, **{f"p{p}": None for p in PERCENTILES}}
+    quantiles = np.percentile(values, PERCENTILES)
+    return {
+        "count": int(values.size),
+        "mean": round(float(values.mean()), 2),
+        **{f"p{p}": round(float(q), 2) for p, q in zip(PERCENTILES, quantiles)},
+    }
+
+
+def histogram(hours, bins):
+    values = hours[~np.isnan(hours)]
+    if values.size == 0:
+        return {"edges": [], "counts": []}
+    counts, edges = np.histogram(values, bins=bins)
+    return {"edges": [round(float(edge), 2) for edge in edges], "counts": counts.tolist()}
+
+
+def weekly_done(done):
+    # Number of tasks first reaching DONE in each week (weeks start on Monday).
+    finished = done[~np.isnan(done)]
+    if finished.size == 0:
+        return []
+    weeks = np.floor((finished - MONDAY_OFFSET) / SECONDS_PER_WEEK).astype(np.int64)
+    labels, counts = np.unique(weeks, return_counts=True)
+    starts = (labels * SECONDS_PER_WEEK + MONDAY_OFFSET).astype("datetime64[s]").astype("datetime64[D]")
+    return [{"week": str(start), "done": int(count)} for start, count in zip(starts, counts)]
+
+
+def hours_or_none(value):
+    return None if np.isnan(value) else round(float(value), 2)
+
+
+def group_summaries(group, hours, names):
+    # Per-group summaries: one sort, then each group is a contiguous slice.
+    keep = ~np.isnan(hours)
+    group, hours = group[keep], hours[keep]
+    order = np.argsort(group, kind="stable")
+    group, hours = group[order], hours[order]
+    bounds = np.searchsorted(group, np.arange(len(names) + 1))
+    return {name: summarize(hours[bounds[i]:bounds[i + 1]]) for i, name in enumerate(names)}
+
+
+def project_flow(events):
+    # Worker for one project: returns its milestone arrays so the caller can aggregate them.
+    event_task, event_status, event_time = extract_transitions(events)
+    return task_milestones(event_task, event_status, event_time, len(events))
+
+
+def flow_report(history_data, projects, workers=None, bins=10):
+    # Builds the cycle time / throughput report for every project in the store.
+    per_project = [[status_events(history_data.get(task["id"], [])) for task in project["tasks"]]
+                   for project in projects]
+    event_count = sum(len(events) for tasks in per_project for events in tasks)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1 and len(per_project) > 1 and event_count >= POOL_MIN_EVENTS:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(project_flow, per_project))
+    else:
+        results = [project_flow(tasks) for tasks in per_project]
+
+    milestones = {name: np.concatenate([r[name] for r in results]) if results else np.array([])
+                  for name in ("TODO", "DOING", "DONE")}
+    task_project = np.repeat(np.arange(len(projects)), [len(tasks) for tasks in per_project])
+
+    todo_to_doing = durations(milestones["TODO"], milestones["DOING"])
+    doing_to_done = durations(milestones["DOING"], milestones["DONE"])
+    cycle_time = durations(milestones["TODO"], milestones["DONE"])
+
+    # A task with several assignees counts towards each of them.
+    all_tasks = [task for project in projects for task in project["tasks"]]
+    assignee_names = sorted({name for task in all_tasks for name in task.get("assignees", [])})
+    assignee_codes = {name: i for i, name in enumerate(assignee_names)}
+    assignee_task, assignee_group = [], []
+    for position, task in enumerate(all_tasks):
+        for name in task.get("assignees", []):
+            assignee_task.append(position)
+            assignee_group.append(assignee_codes[name])
+    assignee_task = np.array(assignee_task, dtype=np.int64)
+
+    return {
+        "generated_at": datetime.now().isoformat(),
+        "tasks": int(task_project.size),
+        "completed": int(np.count_nonzero(~np.isnan(milestones["DONE"]))),
+        "todo_to_doing_hours": summarize(todo_to_doing),
+        "doing_to_done_hours": summarize(doing_to_done),
+        "cycle_time_hours": summarize(cycle_time),
+        "cycle_time_histogram": histogram(cycle_time, bins),
+        "weekly_done": weekly_done(milestones["DONE"]),
+        "by_project": group_summaries(task_project, cycle_time,
+                                      [f"{project['name']} ({project['id'][:8]})" for project in projects]),
+        "by_assignee": group_summaries(np.array(assignee_group, dtype=np.int64), cycle_time[assignee_task],
+                                       assignee_names),
+        "by_task": [{"id": task["id"],
+                     "todo_to_doing_hours": hours_or_none(todo_to_doing[i]),
+                     "doing_to_done_hours": hours_or_none(doing_to_done[i]),
+                     "cycle_time_hours": hours_or_none(cycle_time[i])} for i, task in enumerate(all_tasks)],
+    }
+
+
+def format_report(report):
+    # Plain-text table of the report for the command line.
+    lines = [f"Tasks: {report['tasks']}  Completed: {report['completed']}", ""]
+    header = f"{'Group':<32} {'Count':>6} {'Mean h':>9} " + " ".join(f"{'p' + str(p) + ' h':>9}" for p in PERCENTILES)
+    lines.append(header)
+    lines.append("-" * len(header))
+
+    def row(label, summary):
+        cells = [f"{summary[key]:>9.2f}" if summary[key] is not None else f"{'-':>9}"
+                 for key in ["mean"] + [f"p{p}" for p in PERCENTILES]]
+        lines.append(f"{label[:32]:<32} {summary['count']:>6} " + " ".join(cells))
+
+    row("TODO -> DOING", report["todo_to_doing_hours"])
+    row("DOING -> DONE", report["doing_to_done_hours"])
+    row("Cycle time (TODO -> DONE)", report["cycle_time_hours"])
+    for name, summary in report["by_project"].items():
+        row(f"project {name}", summary)
+    for name, summary in report["by_assignee"].items():
+        row(f"assignee {name}", summary)
+
+    lines.append("")
+    lines.append("Week starting   Done")
+    for week in report["weekly_done"]:
+        lines.append(f"{week['week']:<15} {week['done']:>4}")
+    return "\n".join(lines)
+
+
+def load_store(data_file='data.json', history_file='history.json'):
+    projects, history_data = [], {}
+    if os.path.exists(data_file):
+        with open(data_file, 'r') as file:
+            projects = json.load(file).get('projects', [])
+    if os.path.exists(history_file):
+        with open(history_file, 'r') as file:
+            history_data = json.load(file)
+    return history_data, projects
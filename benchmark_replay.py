@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from history import HistoryManager
+from replay import ReplayEngine, initial_state, apply_event
+
+ACTIONS = [
+    "Changed status to TODO",
+    "Changed status to DOING",
+    "Changed priority to HIGH",
+    "Assigned member karim",
+    "Delete member karim",
+    "Changed status to DONE",
+]
+
+
+def build_history(path, task_id, events):
+    # Writes a history file with one task and `events` entries one minute apart.
+    start = datetime(2024, 1, 1)
+    entries = []
+    for i in range(events):
+        moment = start + timedelta(minutes=i)
+        entries.append({
+            "user": "karim",
+            "action": ACTIONS[i % len(ACTIONS)],
+            "timestamp": moment.isoformat(),
+            "ts": moment.timestamp()
+        })
+    with open(path, 'w') as file:
+        json.dump({task_id: entries}, file)
+    return start, start + timedelta(minutes=events - 1)
+
+
+def full_replay(history_manager, task, at):
+    # Replays every event from the beginning; what the engine would cost without checkpoints.
+    state = initial_state(task)
+    count = history_manager.count_until(task["id"], at)
+    for entry in history_manager.get_history(task["id"])[:count]:
+        apply_event(state, entry)
+    return state
+
+
+def measure(function, repeat):
+    begin = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - begin) / repeat * 1000
+
+
+def run(sizes, repeat):
+    # cold: a new engine with no checkpoint file, as on the very first lookup.
+    # stored: a new engine reading the checkpoint file, as on the first lookup of a later process.
+    # warm: later lookups in the same engine. The history file itself is loaded beforehand for every column.
+    task = {"id": "bench-task", "title": "bench", "start_time": "2023-12-31T00:00:00"}
+    print(f"{'events':>10} {'cold ms':>12} {'stored ms':>12} {'warm ms':>12} {'full replay ms':>15}")
+    for size in sizes:
+        handle, path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        checkpoint_file = os.path.splitext(path)[0] + '.checkpoints.json'
+        try:
+            _, end = build_history(path, task["id"], size)
+            history_manager = HistoryManager(path)
+            history_manager.get_history(task["id"])
+            # Query a moment just before the end so the replay is not aligned to a checkpoint.
+            at = end - timedelta(minutes=3)
+
+            def cold_lookup():
+                if os.path.exists(checkpoint_file):
+                    os.remove(checkpoint_file)
+                ReplayEngine(history_manager).task_state_at(task, at)
+
+            cold = measure(cold_lookup, repeat)
+            stored = measure(lambda: ReplayEngine(history_manager).task_state_at(task, at), repeat)
+            engine = ReplayEngine(history_manager)
+            engine.task_state_at(task, at)
+            warm = measure(lambda: engine.task_state_at(task, at), repeat)
+            full = measure(lambda: full_replay(history_manager, task, at), repeat)
+            print(f"{size:>10} {cold:>12.4f} {stored:>12.4f} {warm:>12.4f} {full:>15.4f}")
+        finally:
+            os.remove(path)
+            if os.path.exists(checkpoint_file):
+                os.remove(checkpoint_file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay latency benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='History lengths to test')
+    parser.add_argument('--repeat', type=int, default=50, help='Lookups per size')
+    args = parser.parse_args()
+    run(args.sizes, args.repeat)
+
+
+#python benchmark_replay.py --sizes 1000 10000 100000
@@ -0,0 +1,63 @@
+from collections import OrderedDict
+
+QUERY_CACHE_BYTES = 8 * 1024 * 1024
+
+
+class QueryCache:
+    # LRU cache for the results of list and detail views.
+    # Every entry records the version of the scopes (project or task ids) it was built from;
+    # mutations bump those versions, so stale entries are never served and age out of the LRU.
+    def __init__(self, max_bytes=QUERY_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._versions = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def bump(self, *scopes):
+        for scope in scopes:
+            self._versions[scope] = self._versions.get(scope, 0) + 1
+
+    def _version(self, scopes, stamp):
+        return tuple(self._versions.get(scope, 0) for scope in scopes) + (stamp,)
+
+    def fetch(self, key, scopes, build, stamp=None):
+        # Returns the cached value for key, or calls build() -> (value, size) and caches it.
+        # `stamp` is an extra version component for data that can change outside this process.
+        version = self._version(scopes, stamp)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        value, size = build()
+        if entry is not None:
+            self.bytes -= entry[2]
+            del self._entries[key]
+        if size <= self.max_bytes:
+            self._entries[key] = (version, value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+        }
@@ -0,0 +1,355 @@
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from datetime import datetime
+
+from comments import CommentStore
+from locking import file_lock, replace_json
+
+TAIL_BLOCK = 4096
+
+
+def _by_key(items, key):
+    return {item[key]: item for item in items}
+
+
+def _changed_fields(before, after):
+    # Returns (before, after) holding only the fields that differ between two records;
+    # a field that was removed appears in `before` only.
+    keys = [key for key in after if key not in before or before[key] != after[key]]
+    keys += [key for key in before if key not in after]
+    return ({key: before[key] for key in keys if key in before},
+            {key: after[key] for key in keys if key in after})
+
+
+def project_fields(project):
+    # A project as the feed sees it; its tasks are reported as task events.
+    return {key: value for key, value in project.items() if key != "tasks"}
+
+
+def change(entity, entity_id, before, after, parent=None):
+    # Builds one (entity, id, parent, op, before, after) change from a record before and after an edit;
+    # before is None for an insert and after is None for a delete.
+    if before is None:
+        return (entity, entity_id, parent, "insert", None, after)
+    if after is None:
+        return (entity, entity_id, parent, "delete", before, None)
+    return (entity, entity_id, parent, "update", *_changed_fields(before, after))
+
+
+def diff_data(before, after):
+    # Compares two versions of data.json and returns the change events between them.
+    # Users are keyed by username, projects and tasks by id; a project's tasks are
+    # reported as separate task events, except when the whole project is deleted.
+    changes = []
+
+    old_users = _by_key(before.get("users", []), "username")
+    new_users = _by_key(after.get("users", []), "username")
+    for username, user in new_users.items():
+        if username not in old_users:
+            changes.append(("user", username, None, "insert", None, user))
+        elif old_users[username] != user:
+            changes.append(("user", username, None, "update", *_changed_fields(old_users[username], user)))
+    for username, user in old_users.items():
+        if username not in new_users:
+            changes.append(("user", username, None, "delete", user, None))
+
+    old_projects = _by_key(before.get("projects", []), "id")
+    new_projects = _by_key(after.get("projects", []), "id")
+    for project_id, project in new_projects.items():
+        fields = project_fields(project)
+        old_project = old_projects.get(project_id)
+        if old_project is None:
+            changes.append(("project", project_id, None, "insert", None, fields))
+            old_tasks = {}
+        else:
+            old_fields = project_fields(old_project)
+            if old_fields != fields:
+                changes.append(("project", project_id, None, "update", *_changed_fields(old_fields, fields)))
+            old_tasks = _by_key(old_project.get("tasks", []), "id")
+
+        new_tasks = _by_key(project.get("tasks", []), "id")
+        for task_id, task in new_tasks.items():
+            if task_id not in old_tasks:
+                changes.append(("task", task_id, {"project_id": project_id}, "insert", None, task))
+            elif old_tasks[task_id] != task:
+                changes.append(("task", task_id, {"project_id": project_id}, "update", *_changed_fields(old_tasks[task_id], task)))
+        for task_id, task in old_tasks.items():
+            if task_id not in new_tasks:
+                changes.append(("task", task_id, {"project_id": project_id}, "delete", task, None))
+    for project_id, project in old_projects.items():
+        if project_id not in new_projects:
+            changes.append(("project", project_id, None, "delete", project, None))
+
+    return changes
+
+
+class ChangeFeed:
+    # Append-only, sequence-numbered log of every change made to data.json and history.json.
+    # One JSON object per line, so readers can tail it and resume from any sequence number.
+    def __init__(self, feed_file='changes.jsonl'):
+        self.feed_file = feed_file
+        self._last_seq = None
+        self._size = None
+        self._lock_depth = 0
+
+    @contextmanager
+    def lock(self):
+        # Holds the feed lock across processes. Writers that change a store file take it
+        # around the write and its events, so readers never see one without the other.
+        # Re-entrant within this feed object.
+        if self._lock_depth:
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+            return
+        with file_lock(self.feed_file):
+            self._lock_depth = 1
+            try:
+                yield
+            finally:
+                self._lock_depth = 0
+
+    def _read_last_seq(self):
+        # Reads only the end of the file to find the last sequence number.
+        if not os.path.exists(self.feed_file):
+            return 0
+        with open(self.feed_file, 'rb') as file:
+            end = file.seek(0, os.SEEK_END)
+            block = TAIL_BLOCK
+            while True:
+                start = max(0, end - block)
+                file.seek(start)
+                # Only lines ending in a newline are complete; the first one may also be cut
+                # off unless the block starts the file.
+                lines = file.read(end - start).split(b"\n")[:-1]
+                if start:
+                    lines = lines[1:]
+                lines = [line for line in lines if line.strip()]
+                if lines:
+                    return json.loads(lines[-1])["seq"]
+                if start == 0:
+                    return 0
+                block *= 2
+
+    def last_seq(self):
+        size = os.path.getsize(self.feed_file) if os.path.exists(self.feed_file) else 0
+        # Another process may have appended since our last write.
+        if self._last_seq is None or size != self._size:
+            self._last_seq = self._read_last_seq()
+            self._size = size
+        return self._last_seq
+
+    def append(self, changes):
+        # Writes (entity, id, parent, op, before, after) changes and returns their events;
+        # parent is None or extra fields naming the owner, e.g. {"project_id": ...} for a task.
+        if not changes:
+            return []
+        # Numbering and writing happen under one lock so sequence numbers stay unique and increasing.
+        with self.lock():
+            seq = self.last_seq()
+            timestamp = datetime.now().isoformat()
+            events = []
+            for entity, entity_id, parent, op, before, after in changes:
+                seq += 1
+                event = {"seq": seq, "timestamp": timestamp, "entity": entity, "id": entity_id, "op": op,
+                         "before": before, "after": after}
+                if parent is not None:
+                    event.update(parent)
+                events.append(event)
+
+            lines = "".join(json.dumps(event, separators=(",", ":")) + "\n" for event in events)
+            with open(self.feed_file, 'a') as file:
+                file.write(lines)
+            self._last_seq = seq
+            self._size = os.path.getsize(self.feed_file)
+        return events
+
+    def record_data_change(self, before, after):
+        return self.append(diff_data(before, after))
+
+    def record_history(self, task_id, entry):
+        return self.append([("history", task_id, None, "insert", None, entry)])
+
+    def record_comment(self, task_id, comment):
+        return self.append([("comment", comment["id"], {"task_id": task_id}, "insert", None, comment)])
+
+    def _offset_after(self, file, seq, size):
+        # Binary search for the byte offset of the first event with a sequence number above seq.
+        low, high = 0, size
+        while low < high:
+            middle = (low + high) // 2
+            file.seek(middle - 1 if middle else 0)
+            if middle:
+                file.readline()
+            line = file.readline()
+            if not line.endswith(b"\n") or json.loads(line)["seq"] > seq:
+                high = middle
+            else:
+                low = middle + 1
+        file.seek(low - 1 if low else 0)
+        if low:
+            file.readline()
+        return file.tell()
+
+    def read_from(self, seq=0, offset=None):
+        # Yields (event, next_offset) for every event after `seq`. When the caller already knows
+        # the byte offset to resume from (see Replica) the search is skipped.
+        if not os.path.exists(self.feed_file):
+            return
+        with open(self.feed_file, 'rb') as file:
+            size = file.seek(0, os.SEEK_END)
+            if offset is None:
+                offset = self._offset_after(file, seq, size)
+            file.seek(offset)
+            while True:
+                line = file.readline()
+                # Stop at a line another process is still writing.
+                if not line.endswith(b"\n"):
+                    break
+                offset = file.tell()
+                if line.strip():
+                    event = json.loads(line)
+                    if event["seq"] > seq:
+                        yield event, offset
+
+    def events_since(self, seq):
+        # Catch-up API: every event with a sequence number greater than `seq`.
+        return [event for event, _ in self.read_from(seq)]
+
+
+def apply_change(data, history_data, event):
+    # Applies one feed event to in-memory copies of data.json and history.json.
+    entity, op, after = event["entity"], event["op"], event["after"]
+    if entity == "history":
+        entries = history_data.setdefault(event["id"], [])
+        # Applied entries keep their sequence number, so an event applied again after a crash is skipped.
+        if not entries or entries[-1].get("seq", 0) < event["seq"]:
+            entries.append(dict(after, seq=event["seq"]))
+        return
+
+    if entity == "user":
+        records, key = data.setdefault("users", []), "username"
+    elif entity == "project":
+        records, key = data.setdefault("projects", []), "id"
+    else:
+        project = next((p for p in data.get("projects", []) if p["id"] == event["project_id"]), None)
+        if project is None:
+            return
+        records, key = project.setdefault("tasks", []), "id"
+
+    existing = next((record for record in records if record[key] == event["id"]), None)
+    if op == "insert":
+        if existing is None:
+            record = dict(after)
+            if entity == "project":
+                record.setdefault("tasks", [])
+            records.append(record)
+    elif op == "update":
+        if existing is not None:
+            for field in event["before"]:
+                if field not in after:
+                    existing.pop(field, None)
+            existing.update(after)
+    elif op == "delete":
+        if existing is not None:
+            records.remove(existing)
+
+
+class Replica:
+    # Read-only copy of the store kept up to date by tailing the change feed.
+    # Reporting jobs can read replica_dir/data.json, replica_dir/history.json and
+    # replica_dir/comments instead of loading the primary files. History entries applied from
+    # the feed also carry the "seq" of their event.
+    def __init__(self, replica_dir, feed=None, data_file='data.json', history_file='history.json',
+                 comments_dir='comments'):
+        self.replica_dir = replica_dir
+        self.feed = feed or ChangeFeed()
+        self.data_file = data_file
+        self.history_file = history_file
+        self.comments_dir = comments_dir
+        self.comments = CommentStore(os.path.join(replica_dir, 'comments'))
+        self.state_file = os.path.join(replica_dir, 'replica_state.json')
+        self.data = None
+        self.history_data = None
+        self.state = None
+
+    def _load(self):
+        if self.state is not None:
+            return
+        with open(self.state_file, 'r') as file:
+            self.state = json.load(file)
+        with open(os.path.join(self.replica_dir, 'data.json'), 'r') as file:
+            self.data = json.load(file)
+        with open(os.path.join(self.replica_dir, 'history.json'), 'r') as file:
+            self.history_data = json.load(file)
+
+    def bootstrap(self):
+        # Starts a new replica from a copy of the primary and the feed position at that moment.
+        # Writers change the files and append their events under the feed lock, so holding it
+        # here makes the copy match `seq` exactly.
+        os.makedirs(self.replica_dir, exist_ok=True)
+        with self.feed.lock():
+            seq = self.feed.last_seq()
+            for source, name, empty in ((self.data_file, 'data.json', {"users": [], "projects": []}),
+                                        (self.history_file, 'history.json', {})):
+                target = os.path.join(self.replica_dir, name)
+                if os.path.exists(source):
+                    shutil.copyfile(source, target)
+                else:
+                    replace_json(target, empty)
+            if os.path.isdir(self.comments_dir):
+                shutil.copytree(self.comments_dir, self.comments.comments_dir, dirs_exist_ok=True)
+        self.state = {"seq": seq, "offset": None, "timestamp": None}
+        self._save_state()
+        self.state = None
+
+    def _save_state(self):
+        replace_json(self.state_file, self.state)
+
+    def sync(self):
+        # Applies every new event and rewrites the replica files; returns how many were applied.
+        # The first sync bootstraps the replica.
+        if self.state is None and not self.exists():
+            self.bootstrap()
+        self._load()
+        applied = 0
+        touched_data = touched_history = False
+        for event, offset in self.feed.read_from(self.state["seq"], self.state["offset"]):
+            if event["entity"] == "comment":
+                # Comments copied at bootstrap may already be there.
+                if self.comments.count(event["task_id"]) < event["id"]:
+                    self.comments.append_record(event["task_id"], event["after"])
+            else:
+                apply_change(self.data, self.history_data, event)
+                touched_history |= event["entity"] == "history"
+                touched_data |= event["entity"] != "history"
+            self.state = {"seq": event["seq"], "offset": offset, "timestamp": event["timestamp"]}
+            applied += 1
+
+        # Files are replaced whole, so readers never see half of one, and the state goes last: after
+        # a crash the next sync applies the same events again, which changes nothing.
+        if touched_data:
+            replace_json(os.path.join(self.replica_dir, 'data.json'), self.data, indent=4)
+        if touched_history:
+            replace_json(os.path.join(self.replica_dir, 'history.json'), self.history_data, indent=4)
+        if applied:
+            self._save_state()
+        return applied
+
+    def exists(self):
+        return os.path.exists(self.state_file)
+
+    def lag(self):
+        # How far behind the primary the replica is, in events and in seconds.
+        self._load()
+        behind = self.feed.last_seq() - self.state["seq"]
+        seconds = 0.0
+        if behind:
+            pending = next(iter(self.feed.read_from(self.state["seq"], self.state["offset"])), None)
+            if pending is not None:
+                seconds = (datetime.now() - datetime.fromisoformat(pending[0]["timestamp"])).total_seconds()
+        return {"seq": self.state["seq"], "events_behind": behind, "seconds_behind": round(seconds, 3)}
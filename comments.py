@@ -0,0 +1,114 @@
+import json
+import os
+import struct
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+from locking import file_lock
+
+# Each task's comments live in <task_id>.jsonl (one comment per line, append-only) next to
+# <task_id>.idx, which holds the byte offset of every line as an unsigned 64-bit integer.
+OFFSET = struct.Struct("<Q")
+
+
+class CommentStore:
+    # Append-only comment storage kept out of data.json; tasks only keep a count and a pointer.
+    def __init__(self, comments_dir='comments', change_feed=None):
+        self.comments_dir = comments_dir
+        self.change_feed = change_feed
+
+    def _paths(self, task_id):
+        base = os.path.join(self.comments_dir, task_id)
+        return base + ".jsonl", base + ".idx"
+
+    def pointer(self, task_id):
+        # What a task stores instead of its comments.
+        return self._paths(task_id)[0].replace(os.sep, "/")
+
+    def count(self, task_id):
+        # The index is written last, so it only counts comments that were stored completely.
+        index_path = self._paths(task_id)[1]
+        if not os.path.exists(index_path):
+            return 0
+        return os.path.getsize(index_path) // OFFSET.size
+
+    @contextmanager
+    def _locked(self, task_id):
+        # Serialises writers of one task's comments across processes. The feed lock, when there
+        # is a feed, is taken first, in the same order as every other feed writer.
+        os.makedirs(self.comments_dir, exist_ok=True)
+        with self.change_feed.lock() if self.change_feed is not None else nullcontext():
+            with file_lock(self._paths(task_id)[0]):
+                yield
+
+    def append_record(self, task_id, record):
+        # Appends an already numbered comment and returns it. The caller holds the task's lock
+        # (see add) or is the store's only writer, as a replica is.
+        os.makedirs(self.comments_dir, exist_ok=True)
+        segment_path, index_path = self._paths(task_id)
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+        with open(segment_path, 'ab') as segment:
+            offset = segment.tell()
+            segment.write(line)
+        with open(index_path, 'ab') as index:
+            index.write(OFFSET.pack(offset))
+        return record
+
+    def add(self, task_id, username, comment):
+        # Stores a new comment and returns it; ids count up from 1 within a task.
+        with self._locked(task_id):
+            record = {
+                "id": self.count(task_id) + 1,
+                "username": username,
+                "comment": comment,
+                "timestamp": datetime.now().isoformat()
+            }
+            self.append_record(task_id, record)
+            if self.change_feed is not None:
+                self.change_feed.record_comment(task_id, record)
+        return record
+
+    def _read(self, task_id, first, last):
+        # Reads comments first..last (1-based, inclusive) using the offset index.
+        segment_path, index_path = self._paths(task_id)
+        with open(index_path, 'rb') as index:
+            index.seek((first - 1) * OFFSET.size)
+            chunk = index.read((last - first + 1) * OFFSET.size)
+        offsets = [offset for (offset,) in OFFSET.iter_unpack(chunk)]
+        comments = []
+        with open(segment_path, 'rb') as segment:
+            segment.seek(offsets[0])
+            for _ in offsets:
+                comments.append(json.loads(segment.readline()))
+        return comments
+
+    def get(self, task_id, comment_id):
+        if not 1 <= comment_id <= self.count(task_id):
+            return None
+        return self._read(task_id, comment_id, comment_id)[0]
+
+    def page(self, task_id, page=0, page_size=10):
+        # One page of comments, newest first.
+        total = self.count(task_id)
+        last = total - page * page_size
+        first = max(1, last - page_size + 1)
+        if last < 1:
+            return []
+        return list(reversed(self._read(task_id, first, last)))
+
+    def migrate(self, task):
+        # Moves comments stored inline in a task into the store; returns True if the task changed.
+        # Comments already in the store, e.g. moved from another copy of the task, are not added again.
+        inline = task.pop("comments", None)
+        if inline is None and "comments_ref" in task:
+            return False
+        with self._locked(task["id"]):
+            for number, comment in enumerate(inline or [], 1):
+                if number <= self.count(task["id"]):
+                    continue
+                record = self.append_record(task["id"], {"id": number, **comment})
+                if self.change_feed is not None:
+                    self.change_feed.record_comment(task["id"], record)
+            task["comment_count"] = self.count(task["id"])
+        task["comments_ref"] = self.pointer(task["id"])
+        return True
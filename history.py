@@ -0,0 +1,176 @@
+import bisect
+import heapq
+import json
+import os
+from contextlib import nullcontext
+from datetime import datetime
+from itertools import islice
+
+from locking import replace_json
+
+
+def parse_timestamp(value):
+    # Converts an ISO timestamp (or a datetime / number) to seconds since the epoch.
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return datetime.fromisoformat(value).timestamp()
+
+
+def paginate(iterable, page, page_size):
+    # Returns one page of a (lazy) iterable without materialising the pages before it.
+    start = page * page_size
+    return list(islice(iterable, start, start + page_size))
+
+
+#class for save data in history file and load data
+class HistoryManager:
+    def __init__(self, history_file='history.json', change_feed=None):
+        self.history_file = history_file
+        self.change_feed = change_feed
+        if not os.path.exists(self.history_file):
+            with open(self.history_file, 'w') as file:
+                json.dump({}, file)
+        # In-memory copy of the history file and its indexes, built on first query.
+        self._history_data = None
+        self._file_stamp = None
+        self._task_keys = {}
+        self._user_index = {}
+        self._user_keys = {}
+
+    def _read(self):
+        with open(self.history_file, 'r') as file:
+            history_data = json.load(file)
+        # Older entries only carry the ISO string; give every entry a numeric "ts".
+        for entries in history_data.values():
+            for entry in entries:
+                if "ts" not in entry:
+                    entry["ts"] = parse_timestamp(entry["timestamp"])
+            entries.sort(key=lambda entry: entry["ts"])
+        return history_data
+
+    def _stamp(self):
+        stat = os.stat(self.history_file)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _build_indexes(self):
+        self._task_keys = {}
+        self._user_index = {}
+        for task_id, entries in self._history_data.items():
+            self._task_keys[task_id] = [entry["ts"] for entry in entries]
+            for entry in entries:
+                self._user_index.setdefault(entry["user"], []).append((entry["ts"], task_id, entry))
+        for rows in self._user_index.values():
+            rows.sort(key=lambda row: row[0])
+        self._user_keys = {user: [row[0] for row in rows] for user, rows in self._user_index.items()}
+
+    def _refresh(self):
+        # Reloads the file only when another process (or manager) has changed it.
+        stamp = self._stamp()
+        if self._history_data is None or stamp != self._file_stamp:
+            self._history_data = self._read()
+            self._file_stamp = stamp
+            self._build_indexes()
+        return self._history_data
+
+    def _index_entry(self, task_id, entry):
+        # Keeps the indexes sorted when a new entry arrives (normally appended at the end).
+        keys = self._task_keys.setdefault(task_id, [])
+        position = bisect.bisect_right(keys, entry["ts"])
+        keys.insert(position, entry["ts"])
+        self._history_data.setdefault(task_id, []).insert(position, entry)
+
+        user_keys = self._user_keys.setdefault(entry["user"], [])
+        position = bisect.bisect_right(user_keys, entry["ts"])
+        user_keys.insert(position, entry["ts"])
+        self._user_index.setdefault(entry["user"], []).insert(position, (entry["ts"], task_id, entry))
+
+    def add_history(self, task_id, user, action):
+        # The read, the write and the feed event all happen under the feed lock, so concurrent
+        # writers never lose each other's entries and the file always matches the feed.
+        with self.change_feed.lock() if self.change_feed is not None else nullcontext():
+            if self._history_data is not None and self._stamp() == self._file_stamp:
+                history_data = self._history_data
+            else:
+                history_data = self._read()
+                self._history_data = history_data
+                self._build_indexes()
+
+            now = datetime.now()
+            entry = {
+                "user": user,
+                "action": action,
+                "timestamp": now.isoformat(),
+                "ts": now.timestamp()
+            }
+            self._index_entry(task_id, entry)
+
+            replace_json(self.history_file, history_data, indent=4)
+            self._file_stamp = self._stamp()
+            if self.change_feed is not None:
+                self.change_feed.record_history(task_id, entry)
+
+    def version(self):
+        # Changes whenever the history file is rewritten, by this or any other process.
+        return self._stamp()
+
+    def get_history(self, task_id):
+        return self._refresh().get(task_id, [])
+
+    @staticmethod
+    def _bounds(keys, since, until):
+        # Binary search for the [since, until] slice of a sorted list of timestamps.
+        since = parse_timestamp(since)
+        until = parse_timestamp(until)
+        low = 0 if since is None else bisect.bisect_left(keys, since)
+        high = len(keys) if until is None else bisect.bisect_right(keys, until)
+        return low, high
+
+    def get_task_range(self, task_id, since=None, until=None):
+        # Returns the entries of one task whose timestamp falls in [since, until].
+        entries = self._refresh().get(task_id, [])
+        low, high = self._bounds(self._task_keys.get(task_id, []), since, until)
+        return entries[low:high]
+
+    def count_until(self, task_id, until):
+        # Number of entries of a task recorded at or before `until`.
+        self._refresh()
+        return self._bounds(self._task_keys.get(task_id, []), None, until)[1]
+
+    def get_user_range(self, username, since=None, until=None):
+        # Returns (task_id, entry) pairs for everything one user did in [since, until].
+        self._refresh()
+        rows = self._user_index.get(username, [])
+        low, high = self._bounds(self._user_keys.get(username, []), since, until)
+        return [(task_id, entry) for _, task_id, entry in rows[low:high]]
+
+    def _task_stream(self, task_id, since, until, newest_first):
+        entries = self._history_data.get(task_id, [])
+        low, high = self._bounds(self._task_keys.get(task_id, []), since, until)
+        indexes = range(high - 1, low - 1, -1) if newest_first else range(low, high)
+        for i in indexes:
+            yield entries[i]["ts"], task_id, entries[i]
+
+    def activity_feed(self, task_ids=None, users=None, since=None, until=None, newest_first=True):
+        # Lazily merges the per-task streams into one time-ordered feed of (task_id, entry).
+        self._refresh()
+        if users is not None:
+            users = set(users)
+            if len(users) == 1:
+                # A single user's index is already sorted, so a merge is not needed.
+                wanted = None if task_ids is None else set(task_ids)
+                rows = self.get_user_range(next(iter(users)), since, until)
+                if newest_first:
+                    rows.reverse()
+                return ((task_id, entry) for task_id, entry in rows
+                        if wanted is None or task_id in wanted)
+        if task_ids is None:
+            task_ids = list(self._history_data)
+
+        streams = [self._task_stream(task_id, since, until, newest_first) for task_id in task_ids]
+        merged = heapq.merge(*streams, key=lambda row: row[0], reverse=newest_first)
+        return ((task_id, entry) for _, task_id, entry in merged
+                if users is None or entry["user"] in users)
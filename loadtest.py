@@ -0,0 +1,323 @@
+import argparse
+import builtins
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from comments import CommentStore
+
+DEFAULT_MIX = ("register=1,login=2,create_project=1,create_task=3,list_projects=5,list_tasks=5,"
+               "change_status=5,add_comment=4,view_history=3")
+STATUSES = ["BACKLOG", "TODO", "DOING", "DONE", "ARCHIVED"]
+STORE_FILES = ("data.json", "history.json", "changes.jsonl", "comments", "project_management.log")
+
+
+def parse_mix(text):
+    # "register=1,login=2" -> {"register": 1.0, "login": 2.0}
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise ValueError(f"Unknown operation: {name.strip()}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class Script:
+    # Stands in for input(): hands out the answers queued for the next operation.
+    def __init__(self):
+        self.answers = []
+
+    def __call__(self, prompt=""):
+        if not self.answers:
+            raise RuntimeError(f"Unexpected prompt: {prompt!r}")
+        return self.answers.pop(0)
+
+
+class Worker:
+    # One simulated user: registers, logs in and works on its own projects through the
+    # same ProjectManagementSystem methods the menus call.
+    def __init__(self, worker_id, main, rng):
+        self.worker_id = worker_id
+        self.main = main
+        self.rng = rng
+        self.script = Script()
+        self.pms = None
+        self.user = None
+        self.accounts = []
+        self.counter = 0
+        # What this worker successfully wrote; compared with the store after the run.
+        self.expected = {"users": [], "projects": [], "tasks": {}, "status": {}, "history": {}, "comments": {}}
+
+    def answer(self, *answers):
+        self.script.answers = list(answers)
+
+    def next_name(self, kind):
+        self.counter += 1
+        return f"w{self.worker_id}-{kind}{self.counter}"
+
+    def own_projects(self):
+        return [p for p in self.pms.data["projects"] if p["owner"] == self.user.username]
+
+    def own_tasks(self):
+        return [(p, t) for p in self.own_projects() for t in p["tasks"]]
+
+    def start_session(self):
+        # A new session reloads data.json, just like starting the program again.
+        self.pms = self.main.ProjectManagementSystem()
+        self.user = None
+
+    def prerequisite(self, operation):
+        # Operations that need an account, a login, a project or a task get one first.
+        if operation != "register" and not self.accounts:
+            return "register"
+        if operation not in ("register", "login") and self.user is None:
+            return "login"
+        if operation in ("create_task", "list_tasks") and not self.own_projects():
+            return "create_project"
+        if operation in ("change_status", "add_comment", "view_history") and not self.own_tasks():
+            return "create_task" if self.own_projects() else "create_project"
+        return operation
+
+    def register(self):
+        username = self.next_name("user")
+        password = f"pass-{username}"
+        self.answer(f"{username}@example.com", username, password)
+        self.main.User.register()
+        self.accounts.append((username, password))
+        self.expected["users"].append(username)
+
+    def login(self):
+        username, password = self.rng.choice(self.accounts)
+        self.answer(username, password)
+        self.user = self.main.User.login()
+        if self.user is None:
+            # The account was lost (e.g. overwritten by another session); register a new one next.
+            self.accounts.remove((username, password))
+            raise RuntimeError(f"Login failed for {username}")
+
+    def create_project(self):
+        self.answer(self.next_name("project"))
+        self.pms.create_project(self.user)
+        self.expected["projects"].append(self.pms.data["projects"][-1]["id"])
+
+    def create_task(self):
+        project = self.rng.choice(self.own_projects())
+        self.answer(self.next_name("task"), "load test task")
+        self.pms.create_task(self.user, project)
+        task = project["tasks"][-1]
+        self.expected["tasks"][task["id"]] = project["id"]
+        self.expected["status"][task["id"]] = task["status"]
+
+    def list_projects(self):
+        self.answer("back")
+        self.pms.list_projects(self.user)
+
+    def list_tasks(self):
+        project = self.rng.choice(self.own_projects())
+        self.answer("back")
+        self.pms.list_tasks(self.user, project)
+
+    def change_status(self):
+        project, task = self.rng.choice(self.own_tasks())
+        status = self.rng.choice(STATUSES)
+        self.answer(status)
+        self.pms.change_status(self.user, project, task)
+        self.expected["status"][task["id"]] = status
+        self.expected["history"][task["id"]] = self.expected["history"].get(task["id"], 0) + 1
+
+    def add_comment(self):
+        project, task = self.rng.choice(self.own_tasks())
+        self.answer(f"comment from worker {self.worker_id}")
+        self.pms.add_comment(self.user, project, task)
+        self.expected["history"][task["id"]] = self.expected["history"].get(task["id"], 0) + 1
+        self.expected["comments"][task["id"]] = self.expected["comments"].get(task["id"], 0) + 1
+
+    def view_history(self):
+        _, task = self.rng.choice(self.own_tasks())
+        self.pms.view_history(task)
+
+
+OPERATIONS = {name: getattr(Worker, name) for name in
+              ("register", "login", "create_project", "create_task", "list_projects", "list_tasks",
+               "change_status", "add_comment", "view_history")}
+
+
+def run_worker(worker_id, store_dir, mix, sessions, operations, seed, start_at):
+    # Runs in its own process: drives the interactive flows with scripted input.
+    os.chdir(store_dir)
+    import main
+
+    worker = Worker(worker_id, main, random.Random(seed + worker_id))
+    builtins.input = worker.script
+    main.getch = lambda: None
+    main.cls = lambda: None
+    main.console.file = open(os.devnull, 'w')
+
+    names, weights = list(mix), list(mix.values())
+    latencies = {name: [] for name in OPERATIONS}
+    errors = {}
+    time.sleep(max(0.0, start_at - time.time()))
+
+    for _ in range(sessions):
+        try:
+            worker.start_session()
+        except Exception as error:
+            # Typically data.json caught half-written by another worker; the session is lost.
+            key = f"start_session: {type(error).__name__}"
+            errors[key] = errors.get(key, 0) + 1
+            continue
+        for _ in range(operations):
+            operation = worker.prerequisite(worker.rng.choices(names, weights)[0])
+            begin = time.perf_counter()
+            try:
+                getattr(worker, operation)()
+            except Exception as error:
+                key = f"{operation}: {type(error).__name__}"
+                errors[key] = errors.get(key, 0) + 1
+                if operation == "login":
+                    worker.user = None
+                continue
+            latencies[operation].append((time.perf_counter() - begin) * 1000)
+
+    return {"latencies": latencies, "errors": errors, "expected": worker.expected}
+
+
+def latency_summary(latencies, elapsed):
+    summary = {}
+    for name, values in latencies.items():
+        if not values:
+            continue
+        p50, p95, p99 = np.percentile(np.array(values), [50, 95, 99])
+        summary[name] = {"count": len(values), "ops_per_sec": round(len(values) / elapsed, 2),
+                         "p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2),
+                         "p99_ms": round(float(p99), 2)}
+    return summary
+
+
+def load_json(path, problems):
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError) as error:
+        problems.append(f"{os.path.basename(path)}: {type(error).__name__}: {error}")
+        return None
+
+
+def check_integrity(store_dir, results):
+    # Compares what the workers wrote with what ended up in the store.
+    corrupt = []
+    data = load_json(os.path.join(store_dir, 'data.json'), corrupt) or {"users": [], "projects": []}
+    history = load_json(os.path.join(store_dir, 'history.json'), corrupt) or {}
+
+    users = {user["username"] for user in data.get("users", [])}
+    projects = {project["id"] for project in data.get("projects", [])}
+    tasks = {task["id"]: task for project in data.get("projects", []) for task in project["tasks"]}
+
+    report = {"corrupt_files": corrupt, "lost_users": [], "lost_projects": [], "lost_tasks": [],
+              "lost_status_updates": [], "lost_history_entries": 0, "lost_comments": 0,
+              "orphaned_history": sorted(task_id for task_id in history if task_id not in tasks),
+              "comment_count_mismatches": [], "feed_sequence_problems": 0}
+
+    comment_store = CommentStore(os.path.join(store_dir, 'comments'))
+    for result in results:
+        expected = result["expected"]
+        report["lost_users"] += [name for name in expected["users"] if name not in users]
+        report["lost_projects"] += [pid for pid in expected["projects"] if pid not in projects]
+        report["lost_tasks"] += [tid for tid in expected["tasks"] if tid not in tasks]
+        report["lost_status_updates"] += [tid for tid, status in expected["status"].items()
+                                          if tid in tasks and tasks[tid]["status"] != status]
+        for task_id, count in expected["history"].items():
+            report["lost_history_entries"] += max(0, count - len(history.get(task_id, [])))
+        for task_id, count in expected["comments"].items():
+            report["lost_comments"] += max(0, count - comment_store.count(task_id))
+
+    for task_id, task in tasks.items():
+        if "comment_count" in task and task["comment_count"] != comment_store.count(task_id):
+            report["comment_count_mismatches"].append(task_id)
+
+    # Every change feed sequence number should appear exactly once.
+    feed_path = os.path.join(store_dir, 'changes.jsonl')
+    if os.path.exists(feed_path):
+        with open(feed_path, 'r') as file:
+            seqs = [json.loads(line)["seq"] for line in file if line.strip()]
+        report["feed_sequence_problems"] = len(seqs) - len(set(seqs)) + (max(seqs, default=0) - len(set(seqs)))
+    return report
+
+
+def format_results(summary, errors, integrity, elapsed, total):
+    lines = [f"{total} operations in {elapsed:.2f}s ({total / elapsed:.1f} ops/s)", ""]
+    lines.append(f"{'Operation':<16} {'Count':>7} {'ops/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, row in summary.items():
+        lines.append(f"{name:<16} {row['count']:>7} {row['ops_per_sec']:>8.2f} {row['p50_ms']:>9.2f} "
+                     f"{row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}")
+    if errors:
+        lines.append("")
+        lines.append("Errors:")
+        for key, count in sorted(errors.items()):
+            lines.append(f"  {key}: {count}")
+    lines.append("")
+    lines.append("Integrity:")
+    for key, value in integrity.items():
+        shown = len(value) if isinstance(value, list) else value
+        lines.append(f"  {key}: {shown}")
+    return "\n".join(lines)
+
+
+def run(workers, sessions, operations, mix, seed, store_dir=None, json_path=None):
+    if store_dir is None:
+        store_dir = tempfile.mkdtemp(prefix="pms-loadtest-")
+    os.makedirs(store_dir, exist_ok=True)
+    existing = [name for name in STORE_FILES if os.path.exists(os.path.join(store_dir, name))]
+    if existing:
+        print(f"{store_dir} already holds {', '.join(existing)}; use an empty directory.")
+        return None
+    store_dir = os.path.abspath(store_dir)
+    print(f"Store: {store_dir}")
+
+    start_at = time.time() + 1.0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_worker, i, store_dir, mix, sessions, operations, seed, start_at)
+                   for i in range(workers)]
+        results = [future.result() for future in futures]
+    elapsed = time.time() - start_at
+
+    latencies = {name: [value for result in results for value in result["latencies"][name]] for name in OPERATIONS}
+    errors = {}
+    for result in results:
+        for key, count in result["errors"].items():
+            errors[key] = errors.get(key, 0) + count
+    summary = latency_summary(latencies, elapsed)
+    total = sum(row["count"] for row in summary.values())
+    integrity = check_integrity(store_dir, results)
+
+    print(format_results(summary, errors, integrity, elapsed, total))
+    report = {"store": store_dir, "workers": workers, "elapsed_sec": round(elapsed, 3), "operations": total,
+              "ops_per_sec": round(total / elapsed, 2), "latency": summary, "errors": errors,
+              "integrity": integrity}
+    if json_path:
+        with open(json_path, 'w') as file:
+            json.dump(report, file, indent=4)
+        print(f"Report written to {json_path}.")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent session load test")
+    parser.add_argument('--workers', type=int, default=4, help='Worker processes (simulated users)')
+    parser.add_argument('--sessions', type=int, default=3, help='Sessions per worker; each reloads data.json')
+    parser.add_argument('--ops', type=int, default=20, help='Operations per session')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Operation weights, e.g. "list_tasks=5,add_comment=2"')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed')
+    parser.add_argument('--store', help='Empty directory for the shared store (default: a new temp directory)')
+    parser.add_argument('--json', help='Also write the report to this JSON file')
+    args = parser.parse_args()
+    run(args.workers, args.sessions, args.ops, parse_mix(args.mix), args.seed, args.store, args.json)
+
+
+#python loadtest.py --workers 8 --sessions 5 --ops 30 --json loadtest_report.json
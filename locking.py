@@ -0,0 +1,44 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+
+@contextmanager
+def file_lock(path):
+    # Exclusive lock on `path + ".lock"`, shared by every process working on the same store.
+    # The lock is per open file, so a process must not take the same lock twice.
+    with open(path + '.lock', 'a+b') as handle:
+        if os.name == 'nt':
+            handle.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after about ten seconds; keep waiting.
+                    time.sleep(0.01)
+        else:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == 'nt':
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+def replace_json(path, data, **options):
+    # Writes to a temporary file next to `path` and renames it over `path`, so a reader
+    # sees either the old or the new file, never half of one.
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as file:
+        json.dump(data, file, **options)
+    os.replace(temp_path, path)
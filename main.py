@@ -1,3 +1,4 @@
+import copy
 import json
 import os
 import logging
@@ -8,8 +9,15 @@ import uuid
 from datetime import datetime, timedelta
 from rich.console import Console
 from rich.table import Table
+from rich.segment import Segments
 from enum import Enum
 import bcrypt
+from history import HistoryManager, paginate
+from replay import ReplayEngine
+from cdc import ChangeFeed, apply_change, change, project_fields
+from cache import QueryCache
+from comments import CommentStore
+from locking import replace_json
 
 
 def getch():
@@ -32,6 +40,12 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 console = Console()
+change_feed = ChangeFeed()
+
+ACTIVITY_PAGE_SIZE = 10
+COMMENTS_PAGE_SIZE = 10
+# Query cache scope bumped whenever the set of projects or their members changes.
+ALL_PROJECTS = "projects"
 
 
 class Priority(Enum):
@@ -48,38 +62,6 @@ class Status(Enum):
     DONE = "DONE"
     ARCHIVED = "ARCHIVED"
 
-#class for save data in history file and load data 
-class HistoryManager:
-    def __init__(self, history_file='history.json'):
-        self.history_file = history_file
-        if not os.path.exists(self.history_file):
-            with open(self.history_file, 'w') as file:
-                json.dump({}, file)
-
-    def add_history(self, task_id, user, action):
-        with open(self.history_file, 'r') as file:
-            history_data = json.load(file)
-
-        if task_id not in history_data:
-            history_data[task_id] = []
-
-        timestamp = datetime.now().isoformat()
-        history_data[task_id].append({
-            "user": user,
-            "action": action,
-            "timestamp": timestamp
-        })
-
-        with open(self.history_file, 'w') as file:
-            json.dump(history_data, file, indent=4)
-
-    def get_history(self, task_id):
-        with open(self.history_file, 'r') as file:
-            history_data = json.load(file)
-
-        return history_data.get(task_id, [])
-
-
 class User:
     def __init__(self, email, username, password, active=True):
         self.email = email
@@ -91,7 +73,6 @@ class User:
     @staticmethod
     # Initializes a new user with email, username, hashed password, and active status.
     def register():
-        data = ProjectManagementSystem.load_data()
         email = input("Email: ")
         username = input("Username: ")
         password = input("Password: ")
@@ -101,17 +82,20 @@ class User:
             getch()
             return
 
-        for user in data["users"]:
-            if user["email"] == email or user["username"] == username:
-                console.print("Email or username already exists.", style="bold red")
-                logger.warning("Attempt to register with existing email or username: %s, %s", email, username)
-                getch()
-                return
         # Hashes the password for security
         hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
         new_user = User(email, username, hashed_password)
-        data["users"].append(new_user.__dict__)
-        ProjectManagementSystem.save_data(data)
+        # The check and the save share the feed lock, so two sessions cannot both take the name.
+        with change_feed.lock():
+            data = ProjectManagementSystem.load_data()
+            taken = any(user["email"] == email or user["username"] == username for user in data["users"])
+            if not taken:
+                ProjectManagementSystem.save_data(data, [change("user", username, None, new_user.__dict__)])
+        if taken:
+            console.print("Email or username already exists.", style="bold red")
+            logger.warning("Attempt to register with existing email or username: %s, %s", email, username)
+            getch()
+            return
         console.print("User account created successfully.", style="bold green")
         getch()
         logger.info("New user registered: %s", username)
@@ -152,7 +136,9 @@ class Task:
         self.priority = priority
         self.status = status
         self.assignees = []
-        self.comments = []
+        # Comment bodies are kept in the CommentStore, not in data.json.
+        self.comment_count = 0
+        self.comments_ref = None
 
 
 class Project:
@@ -179,7 +165,10 @@ class ProjectManagementSystem:
     def __init__(self):
         # Initializes the project management system, loading data and initializing the history manager.
         self.data = self.load_data()
-        self.history_manager = HistoryManager()
+        self.history_manager = HistoryManager(change_feed=change_feed)
+        self.replay_engine = ReplayEngine(self.history_manager)
+        self.query_cache = QueryCache()
+        self.comment_store = CommentStore(change_feed=change_feed)
 
     @staticmethod
     def load_data():
@@ -190,9 +179,38 @@ class ProjectManagementSystem:
         return {"users": [], "projects": []}
 
     @staticmethod
-    def save_data(data):
-        with open('data.json', 'w') as file:
-            json.dump(data, file, indent=4)
+    def save_data(data, changes=()):
+        # `changes` describes what the caller edited in `data` (see cdc.change). Other sessions may
+        # have saved since `data` was loaded, so under the feed lock the changes are applied to the
+        # file as it is now, the same way a replica applies them, and recorded in the change feed.
+        # `data` is then brought up to date with the file.
+        with change_feed.lock():
+            current = ProjectManagementSystem.load_data()
+            for event in change_feed.append(list(changes)):
+                apply_change(current, {}, event)
+            replace_json('data.json', current, indent=4)
+        data.clear()
+        data.update(current)
+
+    @staticmethod
+    def render(table):
+        # Lays a table out once; the segments can be printed again without re-rendering.
+        segments = list(console.render(table))
+        return Segments(segments), sum(len(segment.text) for segment in segments) + 64 * len(segments)
+
+    @staticmethod
+    def task_change(project, before, task):
+        # The change-feed record for an edit to one task; `before` is a copy taken before the edit.
+        return change("task", task["id"], before, task, {"project_id": project.get("id")})
+
+    def changed(self, project, task=None, listing=False):
+        # Bumps the versions the query cache checks, so views of what changed are rebuilt.
+        scopes = [project.get("id")]
+        if task is not None:
+            scopes.append(task["id"])
+        if listing:
+            scopes.append(ALL_PROJECTS)
+        self.query_cache.bump(*scopes)
 
     def main_menu(self):
         while True:
@@ -218,7 +236,8 @@ class ProjectManagementSystem:
             console.print(f"[bold blue]Welcome, {user.username}[/bold blue]")
             console.print("1. Create Project")
             console.print("2. View Projects")
-            console.print("3. Logout")
+            console.print("3. My Activity")
+            console.print("4. Logout")
 
             choice = input("Enter your choice: ")
             if choice == "1":
@@ -227,6 +246,9 @@ class ProjectManagementSystem:
             elif choice == "2":
                 self.list_projects(user)
             elif choice == "3":
+                self.user_activity(user)
+            elif choice == "4":
+                logger.info("Query cache for %s: %s", user.username, self.query_cache.stats())
                 break
             else:
                 console.print("Invalid choice.", style="bold red")
@@ -237,12 +259,13 @@ class ProjectManagementSystem:
         project_name = input("Project Name: ")
         new_project = Project(project_name, user.username)
         self.data["projects"].append(new_project.__dict__)
-        self.save_data(self.data)
+        self.save_data(self.data, [change("project", new_project.id, None, project_fields(new_project.__dict__))])
+        self.changed(new_project.__dict__, listing=True)
         console.print("Project created successfully.", style="bold green")
         logger.info("Project created: %s by %s", project_name, user.username)
         
         
-    def list_projects(self, user):
+    def build_project_list(self, user):
         table = Table(title="Projects")
         table.add_column("Project Name", justify="center")
         table.add_column("Role", justify="center")
@@ -255,7 +278,15 @@ class ProjectManagementSystem:
                 role = "Owner"
             table.add_row(project["name"], role)
 
-        console.print(table)
+        rendered, size = self.render(table)
+        return (user_projects, rendered), size
+
+    def list_projects(self, user):
+        user_projects, rendered = self.query_cache.fetch(
+            ("projects", user.username, None, 0, console.width), [ALL_PROJECTS],
+            lambda: self.build_project_list(user))
+
+        console.print(rendered)
         project_name = input("Enter project name (or 'back' to go back): ")
         if project_name == "back":
             return
@@ -274,7 +305,9 @@ class ProjectManagementSystem:
             console.print("3. Manage Tasks")
             console.print("4. Remove Member")
             console.print("5. List of Members")
-            console.print("6. Back")
+            console.print("6. Project Activity")
+            console.print("7. Project as of Date")
+            console.print("8. Back")
 
             choice = input("Enter your choice: ")
             if choice == "1":
@@ -292,6 +325,11 @@ class ProjectManagementSystem:
                 self.list_members(user, project)
                 getch()
             elif choice == "6":
+                self.project_activity(project)
+            elif choice == "7":
+                self.project_as_of(project)
+                getch()
+            elif choice == "8":
                 break
             else:
                 console.print("Invalid choice.", style="bold red")
@@ -311,8 +349,10 @@ class ProjectManagementSystem:
 
         for u in self.data["users"]:
             if u["username"] == username:
+                before = copy.deepcopy(project_fields(project))
                 project["members"].append(username)
-                self.save_data(self.data)
+                self.save_data(self.data, [change("project", project.get("id"), before, project_fields(project))])
+                self.changed(project, listing=True)
                 console.print("New member added successfully.", style="bold green")
                 return
 
@@ -327,21 +367,26 @@ class ProjectManagementSystem:
         username = input("Enter the username of the member to remove: ")
 
         if username in project["members"]:
+            before = copy.deepcopy(project_fields(project))
             project["members"].remove(username)
-            self.save_data(self.data)
+            self.save_data(self.data, [change("project", project["id"], before, project_fields(project))])
+            self.changed(project, listing=True)
             console.print("Member removed successfully.", style="bold green")
         else:
             console.print("User not a member of the project.", style="bold red")
 
     def list_members(self, user, project):
-        table = Table(title=f"Members of Project: {project['name']}")
-        table.add_column("Username", justify="center")
+        def build():
+            table = Table(title=f"Members of Project: {project['name']}")
+            table.add_column("Username", justify="center")
 
-        for member in project["members"]:
-            table.add_row(member)
+            for member in project["members"]:
+                table.add_row(member)
+            return self.render(table)
 
+        rendered = self.query_cache.fetch(("members", None, project["id"], 0, console.width), [project["id"]], build)
         cls()
-        console.print(table)
+        console.print(rendered)
 
 
 
@@ -351,7 +396,8 @@ class ProjectManagementSystem:
             return
 
         self.data["projects"] = [p for p in self.data["projects"] if p["id"] != project["id"]]
-        self.save_data(self.data)
+        self.save_data(self.data, [change("project", project["id"], project, None)])
+        self.changed(project, listing=True)
         console.print("Project deleted successfully.", style="bold green")
         logger.info("Project deleted: %s by %s", project["name"], user.username)
 
@@ -399,16 +445,18 @@ class ProjectManagementSystem:
             "assignees": [],
             "priority": priority,
             "status": status,
-            "comments": [],
-            
+            "comment_count": 0,
+            "comments_ref": self.comment_store.pointer(task_id),
+
         }
 
         project["tasks"].append(new_task)
-        self.save_data(self.data)
+        self.save_data(self.data, [change("task", task_id, None, new_task, {"project_id": project.get("id")})])
+        self.changed(project)
         console.print("Task created successfully.", style="bold green")
         logger.info("Task created: %s in project %s by %s", title, project["name"], user.username)
 
-    def list_tasks(self, user, project):
+    def build_task_list(self, project):
         table = Table(title=f"Tasks for Project: {project['name']}")
         table.add_column("Task Title", justify="center")
         table.add_column("Status", justify="center")
@@ -416,19 +464,28 @@ class ProjectManagementSystem:
         table.add_column("Start Time", justify="center")
         table.add_column("End Time", justify="center")
 
+        tasks_by_title = {}
         for task in project["tasks"]:
             table.add_row(task["title"], task["status"], task["priority"], task["start_time"], task["end_time"])
+            tasks_by_title.setdefault(task["title"], task)
+
+        rendered, size = self.render(table)
+        return (tasks_by_title, rendered), size
+
+    def list_tasks(self, user, project):
+        tasks_by_title, rendered = self.query_cache.fetch(
+            ("tasks", None, project["id"], 0, console.width), [project["id"]],
+            lambda: self.build_task_list(project))
 
         cls()
-        console.print(table)
+        console.print(rendered)
         task_title = input("Enter task title (or 'back' to go back): ")
         if task_title == "back":
             return
 
-        for task in project["tasks"]:
-            if task["title"] == task_title:
-                self.task_menu(user, project, task)
-                break
+        task = tasks_by_title.get(task_title)
+        if task is not None:
+            self.task_menu(user, project, task)
 
     def task_menu(self, user, project, task):
         while True:
@@ -462,7 +519,6 @@ class ProjectManagementSystem:
                 getch()
             elif choice == "4":
                 self.view_comments(task)
-                getch()
             elif choice == "8":
                 self.view_history(task)
                 getch()    
@@ -485,9 +541,11 @@ class ProjectManagementSystem:
         console.print("Available statuses: BACKLOG, TODO, DOING, DONE, ARCHIVED")
         new_status = input("Enter new status: ").upper()
         if new_status in Status.__members__:
+            before = copy.deepcopy(task)
             task["status"] = new_status
             self.history_manager.add_history(task['id'], user.username, f"Changed status to {new_status}")
-            self.save_data(self.data)
+            self.save_data(self.data, [self.task_change(project, before, task)])
+            self.changed(project, task)
             console.print("Task status updated successfully.", style="bold green")
             logger.info("Status of task %s in project %s changed to %s by %s", task["title"], project["name"],new_status, user.username)
         else:
@@ -503,9 +561,11 @@ class ProjectManagementSystem:
         console.print("Available priorities: CRITICAL, HIGH, MEDIUM, LOW")
         new_priority = input("Enter new priority: ").upper()
         if new_priority in Priority.__members__:
+            before = copy.deepcopy(task)
             task["priority"] = new_priority
             self.history_manager.add_history(task['id'], user.username, f"Changed priority to {new_priority}")
-            self.save_data(self.data)
+            self.save_data(self.data, [self.task_change(project, before, task)])
+            self.changed(project, task)
             console.print("Task priority updated successfully.", style="bold green")
             logger.info("Priority of task %s in project %s changed to %s by %s", task["title"], project["name"],new_priority, user.username)
         else:
@@ -513,14 +573,14 @@ class ProjectManagementSystem:
 
     def add_comment(self, user, project, task):
         comment = input("Enter your comment: ")
-        new_comment = {
-            "username": user.username,
-            "comment": comment,
-            "timestamp": datetime.now().isoformat()
-        }
-        task["comments"].append(new_comment)
-        self.history_manager.add_history(task['id'],user.username, f"add new comment: {new_comment['comment']}")
-        self.save_data(self.data)
+        before = copy.deepcopy(task)
+        # Tasks saved before the comment store existed still carry their comments inline.
+        self.comment_store.migrate(task)
+        new_comment = self.comment_store.add(task["id"], user.username, comment)
+        task["comment_count"] = new_comment["id"]
+        self.history_manager.add_history(task['id'],user.username, f"add new comment #{new_comment['id']}")
+        self.save_data(self.data, [self.task_change(project, before, task)])
+        self.changed(project, task)
         console.print("Comment added successfully.", style="bold green")
         logger.info("Comment added to task %s in project %s by %s", task["title"], project["name"], user.username)
 
@@ -534,9 +594,11 @@ class ProjectManagementSystem:
         assignee = input("Enter username of the member to assign: ")
         if assignee in project["members"]:
             if assignee not in task["assignees"]:
+                before = copy.deepcopy(task)
                 task["assignees"].append(assignee)
                 self.history_manager.add_history(task['id'], user.username, f"Assigned member {assignee}")
-                self.save_data(self.data)
+                self.save_data(self.data, [self.task_change(project, before, task)])
+                self.changed(project, task)
                 console.print("Member assigned to task successfully.", style="bold green")
                 logger.info("Member %s assigned to task %s in project %s by %s", assignee, task["title"],project["name"], user.username)
             else:
@@ -545,14 +607,17 @@ class ProjectManagementSystem:
             console.print("User is not a member of this project.", style="bold red")
             
     def list_assignees(self, task):
-        table = Table(title=f"Members for Task: {task['title']}")
-        table.add_column("Username", justify="center")
+        def build():
+            table = Table(title=f"Members for Task: {task['title']}")
+            table.add_column("Username", justify="center")
 
-        for member in task["assignees"]:
-            table.add_row(member)
+            for member in task["assignees"]:
+                table.add_row(member)
+            return self.render(table)
 
+        rendered = self.query_cache.fetch(("assignees", None, task["id"], 0, console.width), [task["id"]], build)
         cls()
-        console.print(table)
+        console.print(rendered)
 
     def remove_assignees(self, user, project,task):
         if project["owner"] != user.username:
@@ -563,34 +628,165 @@ class ProjectManagementSystem:
         username = input("Enter the username of the member to remove: ")
 
         if username in task["assignees"]:
+            before = copy.deepcopy(task)
             task["assignees"].remove(username)
             self.history_manager.add_history(task['id'], user.username, f"Delete member {username}")
-            self.save_data(self.data)
+            self.save_data(self.data, [self.task_change(project, before, task)])
+            self.changed(project, task)
             console.print("Member removed successfully.", style="bold green")
             logger.info("Member %s deleted from task %s in project %s by %s", username, task["title"],project["name"], user.username)
         else:
             console.print("User not a member of the project.", style="bold red")
 
-    @staticmethod
-    def view_comments(task):
-        if not task["comments"]:
+    def comment_page(self, task, page):
+        # Tasks not yet moved by `manager.py migrate-comments` still hold their comments inline.
+        if "comments" not in task:
+            return self.comment_store.page(task["id"], page, COMMENTS_PAGE_SIZE)
+        numbered = [{"id": number, **comment} for number, comment in enumerate(task["comments"], 1)]
+        return paginate(reversed(numbered), page, COMMENTS_PAGE_SIZE)
+
+    def view_comments(self, task):
+        # Shows the task's comments newest first, one page at a time.
+        total = len(task["comments"]) if "comments" in task else self.comment_store.count(task["id"])
+        if not total:
             console.print("No comments available for this task.", style="bold red")
-        else:
-            for comment in task["comments"]:
+            getch()
+            return
+
+        page = 0
+        while True:
+            cls()
+            console.print(f"[bold blue]Comments for Task: {task['title']} (page {page + 1})[/bold blue]")
+            comments = self.comment_page(task, page)
+            for comment in comments:
                 console.print(
-                    f"[bold yellow]{comment['timestamp']} - {comment['username']}:[/bold yellow] {comment['comment']}")
+                    f"[bold yellow]#{comment['id']} {comment['timestamp']} - {comment['username']}:[/bold yellow] {comment['comment']}")
+            if not comments:
+                console.print("No more comments.", style="bold red")
+            console.print("n. Older  p. Newer  b. Back")
+
+            choice = input("Enter your choice: ")
+            if choice == "n" and (page + 1) * COMMENTS_PAGE_SIZE < total:
+                page += 1
+            elif choice == "p" and page > 0:
+                page -= 1
+            elif choice == "b":
+                break
 
     def view_history(self, task):
         # Displays the history of actions taken on a specific task.
         console.print(f"[bold blue]History for Task: {task['title']}[/bold blue]")
-        table = Table(title="Task History")
+
+        def build():
+            table = Table(title="Task History")
+            table.add_column("User", justify="center")
+            table.add_column("Action", justify="center")
+            table.add_column("Timestamp", justify="center")
+            for entry in self.history_manager.get_history(task['id']):
+                table.add_row(entry["user"], entry["action"], entry["timestamp"])
+            return self.render(table)
+
+        # History can also be written by other sessions, so the file version is part of the key.
+        rendered = self.query_cache.fetch(("history", None, task["id"], 0, console.width), [task["id"]], build,
+                                          stamp=self.history_manager.version())
+        console.print(rendered)
+
+    def project_as_of(self, project):
+        # Rebuilds the project's tasks from history as they were at the given moment.
+        at = input("Date (YYYY-MM-DD or YYYY-MM-DDTHH:MM): ").strip()
+        try:
+            at = datetime.fromisoformat(at)
+        except ValueError:
+            console.print("Invalid date.", style="bold red")
+            return
+
+        snapshot = self.replay_engine.project_state_at(project, at)
+        table = Table(title=f"Project: {project['name']} as of {at.isoformat()}")
+        table.add_column("Task Title", justify="center")
+        table.add_column("Status", justify="center")
+        table.add_column("Priority", justify="center")
+        table.add_column("Assignees", justify="center")
+        table.add_column("Comments", justify="center")
+
+        for task in snapshot["tasks"]:
+            table.add_row(task["title"], task["status"], task["priority"], ", ".join(task["assignees"]),
+                          str(len(task["comments"])))
+
+        cls()
+        console.print(table)
+
+    @staticmethod
+    def read_since():
+        # Asks for the start of the activity window; blank means "from the beginning".
+        since = input("Since (YYYY-MM-DD, blank for all): ").strip()
+        if not since:
+            return None
+        try:
+            return datetime.fromisoformat(since)
+        except ValueError:
+            console.print("Invalid date.", style="bold red")
+            getch()
+            return False
+
+    def task_titles(self):
+        # Maps task ids to (project name, task title) so history rows can be labelled.
+        return {task["id"]: (project["name"], task["title"])
+                for project in self.data["projects"] for task in project["tasks"]}
+
+    def user_activity(self, user):
+        since = self.read_since()
+        if since is False:
+            return
+        self.view_activity(f"Activity of {user.username}", ("activity", user.username, None, since),
+                           lambda: self.history_manager.activity_feed(users=[user.username], since=since))
+
+    def project_activity(self, project):
+        since = self.read_since()
+        if since is False:
+            return
+        task_ids = [task["id"] for task in project["tasks"]]
+        self.view_activity(f"Activity in Project: {project['name']}", ("activity", None, project["id"], since),
+                           lambda: self.history_manager.activity_feed(task_ids=task_ids, since=since))
+
+    def build_activity_page(self, title, feed, page):
+        rows = paginate(feed(), page, ACTIVITY_PAGE_SIZE)
+        titles = self.task_titles()
+        table = Table(title=f"{title} (page {page + 1})")
+        table.add_column("Timestamp", justify="center")
         table.add_column("User", justify="center")
+        table.add_column("Project", justify="center")
+        table.add_column("Task", justify="center")
         table.add_column("Action", justify="center")
-        table.add_column("Timestamp", justify="center")
-        for entry in self.history_manager.get_history(task['id']):
-            table.add_row(entry["user"], entry["action"], entry["timestamp"])
+        for task_id, entry in rows:
+            project_name, task_title = titles.get(task_id, ("-", task_id))
+            table.add_row(entry["timestamp"], entry["user"], project_name, task_title, entry["action"])
+
+        rendered, size = self.render(table)
+        return (len(rows), rendered), size
+
+    def view_activity(self, title, key, feed):
+        # Shows a newest-first activity feed one page at a time.
+        view, username, project_id, since = key
+        # Rows carry project and task names, so pages also depend on the projects, not just the history.
+        scopes = [ALL_PROJECTS] if project_id is None else [ALL_PROJECTS, project_id]
+        page = 0
+        while True:
+            count, rendered = self.query_cache.fetch(
+                (view, username, project_id, page, (since, console.width)), scopes,
+                lambda: self.build_activity_page(title, feed, page), stamp=self.history_manager.version())
+            cls()
+            console.print(rendered)
+            if not count:
+                console.print("No more activity.", style="bold red")
+            console.print("n. Next page  p. Previous page  b. Back")
 
-        console.print(table)
+            choice = input("Enter your choice: ")
+            if choice == "n" and count == ACTIVITY_PAGE_SIZE:
+                page += 1
+            elif choice == "p" and page > 0:
+                page -= 1
+            elif choice == "b":
+                break
 
 
 if __name__ == "__main__":
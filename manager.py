@@ -1,6 +1,13 @@
 import argparse
 import json
 import os
+import time
+from history import HistoryManager, paginate, parse_timestamp
+from replay import ReplayEngine
+from analytics import flow_report, format_report, load_store
+from cdc import ChangeFeed, Replica
+from comments import CommentStore
+from locking import replace_json
 
 
 def create_admin(username, password):
@@ -19,20 +26,25 @@ def create_admin(username, password):
     print("Admin created successfully")
 
 
-def load_users():
+def load_data():
     if os.path.exists('data.json'):
         with open('data.json', 'r') as file:
-            data = json.load(file)
-            return data.get('users', [])
-    return []
+            return json.load(file)
+    return {'users': [], 'projects': []}
+
+
+def load_users():
+    return load_data().get('users', [])
 
 
 def save_users(users):
-    data = {
-        'users': users
-    }
-    with open('data.json', 'w') as file:
-        json.dump(data, file)
+    # Keeps the projects; only the user list is replaced.
+    feed = ChangeFeed()
+    with feed.lock():
+        before = load_data()
+        data = dict(before, users=users)
+        replace_json('data.json', data)
+        feed.record_data_change(before, data)
 
 
 def activate_user(username):
@@ -59,13 +71,139 @@ def deactivate_user(username):
 
 def purge_data():
     if os.path.exists('data.json'):
-        with open('data.json', 'w') as file:
-            json.dump({'users': [], 'projects': []}, file)
+        feed = ChangeFeed()
+        with feed.lock():
+            before = load_data()
+            data = {'users': [], 'projects': []}
+            replace_json('data.json', data)
+            feed.record_data_change(before, data)
         print("All data purged.")
     else:
         print("No data to purge.")    
 
 
+def migrate_comments():
+    # Moves comments stored inside data.json into the comment store.
+    feed = ChangeFeed()
+    store = CommentStore(change_feed=feed)
+    migrated = 0
+    with feed.lock():
+        before = load_data()
+        data = json.loads(json.dumps(before))
+        for project in data.get('projects', []):
+            for task in project['tasks']:
+                if store.migrate(task):
+                    migrated += 1
+        if migrated:
+            replace_json('data.json', data, indent=4)
+            feed.record_data_change(before, data)
+    if not migrated:
+        print("No tasks to migrate.")
+        return
+    print(f"Comments of {migrated} tasks moved to the comment store.")
+
+
+def load_project(project_name):
+    if os.path.exists('data.json'):
+        with open('data.json', 'r') as file:
+            for project in json.load(file).get('projects', []):
+                if project['name'] == project_name:
+                    return project
+    return None
+
+
+def show_snapshot(project_name, at):
+    moment = parse_time(at, '--at')
+    if moment is False:
+        return
+    project = load_project(project_name)
+    if project is None:
+        print(f"Project {project_name} not found.")
+        return
+    snapshot = ReplayEngine(HistoryManager()).project_state_at(project, moment)
+    print(f"Project {project_name} as of {at}:")
+    for task in snapshot['tasks']:
+        print(f"{task['title']}  {task['status']}  {task['priority']}  [{', '.join(task['assignees'])}]  {len(task['comments'])} comments")
+
+
+def show_flow_report(json_path=None, workers=None, bins=10, store_dir='.'):
+    history_data, projects = load_store(os.path.join(store_dir, 'data.json'), os.path.join(store_dir, 'history.json'))
+    report = flow_report(history_data, projects, workers=workers, bins=bins)
+    print(format_report(report))
+    if json_path:
+        with open(json_path, 'w') as file:
+            json.dump(report, file, indent=4)
+        print(f"Report written to {json_path}.")
+
+
+def show_changes(from_seq=0, limit=50):
+    events = ChangeFeed().read_from(from_seq)
+    shown = 0
+    for event, _ in events:
+        if shown == limit:
+            break
+        target = event['id'] if 'project_id' not in event else f"{event['project_id']}/{event['id']}"
+        print(f"{event['seq']:>6}  {event['timestamp']}  {event['op']:<6} {event['entity']:<8} {target}")
+        shown += 1
+    if not shown:
+        print("No changes after this sequence number.")
+
+
+def sync_replica(replica_dir, follow=False, interval=2.0):
+    replica = Replica(replica_dir)
+    while True:
+        applied = replica.sync()
+        lag = replica.lag()
+        print(f"Applied {applied} changes; replica at seq {lag['seq']}, "
+              f"{lag['events_behind']} events / {lag['seconds_behind']}s behind.")
+        if not follow:
+            return
+        time.sleep(interval)
+
+
+def replica_status(replica_dir):
+    replica = Replica(replica_dir)
+    if not replica.exists():
+        print(f"No replica in {replica_dir}. Create one with replica-sync --dir {replica_dir}.")
+        return
+    lag = replica.lag()
+    print(f"Replica at seq {lag['seq']}, {lag['events_behind']} events / {lag['seconds_behind']}s behind.")
+
+
+def parse_time(value, option):
+    # Returns the option as seconds since the epoch, or False after printing an error.
+    if value is None:
+        return None
+    try:
+        return parse_timestamp(float(value) if value.replace('.', '', 1).isdigit() else value)
+    except ValueError:
+        print(f"Invalid {option}: {value}. Use an ISO date such as 2024-05-27 or 2024-05-27T12:00.")
+        return False
+
+
+def show_activity(username=None, project_name=None, since=None, until=None, page=0, page_size=20):
+    since = parse_time(since, '--since')
+    until = parse_time(until, '--until')
+    if since is False or until is False:
+        return
+    task_ids = None
+    if project_name:
+        project = load_project(project_name)
+        if project is None:
+            print(f"Project {project_name} not found.")
+            return
+        task_ids = [task['id'] for task in project['tasks']]
+
+    users = [username] if username else None
+    feed = HistoryManager().activity_feed(task_ids=task_ids, users=users, since=since, until=until)
+    rows = paginate(feed, page, page_size)
+    if not rows:
+        print("No activity found.")
+        return
+    for task_id, entry in rows:
+        print(f"{entry['timestamp']}  {entry['user']}  {task_id}  {entry['action']}")
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Admin Management")
     subparsers = parser.add_subparsers(dest='command')
@@ -82,6 +220,38 @@ if __name__ == "__main__":
 
     purge_data_parser = subparsers.add_parser('purge-data', help='Purge all stored data')
 
+    activity_parser = subparsers.add_parser('activity', help='Show task history, newest first')
+    activity_parser.add_argument('--username', help='Only actions by this user')
+    activity_parser.add_argument('--project', help='Only tasks of this project')
+    activity_parser.add_argument('--since', help='Start of the window (ISO date or timestamp)')
+    activity_parser.add_argument('--until', help='End of the window (ISO date or timestamp)')
+    activity_parser.add_argument('--page', type=int, default=0, help='Page number, starting at 0')
+    activity_parser.add_argument('--page-size', type=int, default=20, help='Entries per page')
+
+    snapshot_parser = subparsers.add_parser('snapshot', help='Show a project as it was at a given time')
+    snapshot_parser.add_argument('--project', required=True, help='Project name')
+    snapshot_parser.add_argument('--at', required=True, help='Point in time (ISO date or timestamp)')
+
+    subparsers.add_parser('migrate-comments', help='Move comments out of data.json into the comment store')
+
+    flow_parser = subparsers.add_parser('flow-report', help='Cycle time and throughput report')
+    flow_parser.add_argument('--json', help='Also write the report to this JSON file')
+    flow_parser.add_argument('--workers', type=int, help='Worker processes for large stores (default: CPU count)')
+    flow_parser.add_argument('--bins', type=int, default=10, help='Cycle time histogram bins')
+    flow_parser.add_argument('--store', default='.', help='Directory holding data.json/history.json (e.g. a replica)')
+
+    changes_parser = subparsers.add_parser('changes', help='List change feed events after a sequence number')
+    changes_parser.add_argument('--from-seq', type=int, default=0, help='Show events after this sequence number')
+    changes_parser.add_argument('--limit', type=int, default=50, help='Maximum events to show')
+
+    replica_parser = subparsers.add_parser('replica-sync', help='Bring a read replica up to date from the change feed')
+    replica_parser.add_argument('--dir', required=True, help='Replica directory')
+    replica_parser.add_argument('--follow', action='store_true', help='Keep tailing the feed')
+    replica_parser.add_argument('--interval', type=float, default=2.0, help='Seconds between polls with --follow')
+
+    replica_status_parser = subparsers.add_parser('replica-status', help='Show how far a replica is behind')
+    replica_status_parser.add_argument('--dir', required=True, help='Replica directory')
+
     args = parser.parse_args()
 
     if args.command == 'create-admin':
@@ -92,6 +262,20 @@ if __name__ == "__main__":
         deactivate_user(args.username)
     elif args.command == 'purge-data':
         purge_data()    
+    elif args.command == 'activity':
+        show_activity(args.username, args.project, args.since, args.until, args.page, args.page_size)
+    elif args.command == 'snapshot':
+        show_snapshot(args.project, args.at)
+    elif args.command == 'migrate-comments':
+        migrate_comments()
+    elif args.command == 'flow-report':
+        show_flow_report(args.json, args.workers, args.bins, args.store)
+    elif args.command == 'changes':
+        show_changes(args.from_seq, args.limit)
+    elif args.command == 'replica-sync':
+        sync_replica(args.dir, args.follow, args.interval)
+    elif args.command == 'replica-status':
+        replica_status(args.dir)
     else:
         parser.print_help()
 
@@ -101,3 +285,10 @@ if __name__ == "__main__":
 #python manager.py create-admin --username admin --password adminpass
 #python manager.py deactivate-user --username user1
 #python3 manager.py purge-data
+#python manager.py snapshot --project "project1" --at 2024-05-27T12:00
+#python manager.py flow-report --json flow_report.json
+#python manager.py migrate-comments
+#python manager.py changes --from-seq 120
+#python manager.py replica-sync --dir replica --follow
+#python manager.py flow-report --store replica
+#python manager.py activity --username user1 --since 2024-05-20 --page 0
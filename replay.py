@@ -0,0 +1,169 @@
+import copy
+import json
+import os
+import re
+
+from history import parse_timestamp
+from locking import replace_json
+
+# Tasks are created as BACKLOG / LOW (see ProjectManagementSystem.create_task) and
+# task creation itself is not written to the history file.
+INITIAL_STATUS = "BACKLOG"
+INITIAL_PRIORITY = "LOW"
+
+CHECKPOINT_INTERVAL = 64
+
+# The history file stores free-text actions; these are the ones that change task state.
+ACTION_PATTERNS = [
+    ("status", re.compile(r"^Changed status to (\w+)$")),
+    ("priority", re.compile(r"^Changed priority to (\w+)$")),
+    ("assign", re.compile(r"^Assigned member (.+)$")),
+    ("unassign", re.compile(r"^Delete member (.+)$")),
+    ("comment", re.compile(r"^add new comment: (.*)$", re.DOTALL)),
+    # Newer entries only reference the comment in the CommentStore.
+    ("comment_ref", re.compile(r"^add new comment #(\d+)$")),
+]
+
+
+def parse_action(action):
+    # Returns (kind, value) for a history action, or (None, None) if it does not change state.
+    for kind, pattern in ACTION_PATTERNS:
+        match = pattern.match(action)
+        if match:
+            return kind, match.group(1)
+    return None, None
+
+
+def initial_state(task):
+    return {
+        "id": task["id"],
+        "title": task["title"],
+        "description": task.get("description", ""),
+        "start_time": task.get("start_time"),
+        "end_time": task.get("end_time"),
+        "status": INITIAL_STATUS,
+        "priority": INITIAL_PRIORITY,
+        "assignees": [],
+        "comments": [],
+    }
+
+
+def apply_event(state, entry):
+    # Applies one history entry to a task state in place.
+    kind, value = parse_action(entry["action"])
+    if kind == "status":
+        state["status"] = value
+    elif kind == "priority":
+        state["priority"] = value
+    elif kind == "assign":
+        if value not in state["assignees"]:
+            state["assignees"].append(value)
+    elif kind == "unassign":
+        if value in state["assignees"]:
+            state["assignees"].remove(value)
+    elif kind == "comment":
+        state["comments"].append({
+            "username": entry["user"],
+            "comment": value,
+            "timestamp": entry["timestamp"]
+        })
+    elif kind == "comment_ref":
+        state["comments"].append({
+            "id": int(value),
+            "username": entry["user"],
+            "timestamp": entry["timestamp"]
+        })
+    return state
+
+
+class ReplayEngine:
+    # Rebuilds tasks and projects as they were at a given time from the history file.
+    # Every CHECKPOINT_INTERVAL events a snapshot of the task is kept, so a lookup
+    # replays at most that many events no matter how long the history is. The snapshots
+    # are also saved next to the history file (history.checkpoints.json), so a new process
+    # such as `manager.py snapshot` starts from them instead of from the first event.
+    def __init__(self, history_manager, checkpoint_interval=CHECKPOINT_INTERVAL, checkpoint_file=None):
+        self.history_manager = history_manager
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_file = checkpoint_file or os.path.splitext(history_manager.history_file)[0] + '.checkpoints.json'
+        self._checkpoints = None
+        self._unsaved = False
+
+    def _load_checkpoints(self):
+        if self._checkpoints is None:
+            self._checkpoints = {}
+            try:
+                with open(self.checkpoint_file, 'r') as file:
+                    stored = json.load(file)
+            except (OSError, ValueError):
+                stored = {}
+            # Snapshots taken at another interval do not line up with this engine's.
+            if stored.get("interval") == self.checkpoint_interval:
+                self._checkpoints = {task_id: [tuple(checkpoint) for checkpoint in checkpoints]
+                                     for task_id, checkpoints in stored["tasks"].items()}
+        return self._checkpoints
+
+    def _save_checkpoints(self):
+        if self._unsaved:
+            replace_json(self.checkpoint_file, {"interval": self.checkpoint_interval, "tasks": self._checkpoints})
+            self._unsaved = False
+
+    def _task_checkpoints(self, task, entries):
+        # Returns [(event_count, last_ts, state)] for the task, extending it when new events arrived.
+        # Stored checkpoints are dropped when the history they were built from has changed.
+        checkpoints = self._load_checkpoints().get(task["id"])
+        if checkpoints is not None:
+            count, last_ts, _ = checkpoints[-1]
+            if count > len(entries) or (count and entries[count - 1]["ts"] != last_ts):
+                checkpoints = None
+        if checkpoints is None:
+            checkpoints = [(0, None, initial_state(task))]
+            self._checkpoints[task["id"]] = checkpoints
+
+        count, _, state = checkpoints[-1]
+        while count + self.checkpoint_interval <= len(entries):
+            state = copy.deepcopy(state)
+            for entry in entries[count:count + self.checkpoint_interval]:
+                apply_event(state, entry)
+            count += self.checkpoint_interval
+            checkpoints.append((count, entries[count - 1]["ts"], state))
+            self._unsaved = True
+        return checkpoints
+
+    def task_state_at(self, task, at):
+        # Returns the task as it was at `at`, or None if it did not exist yet.
+        state = self._task_state_at(task, at)
+        self._save_checkpoints()
+        return state
+
+    def _task_state_at(self, task, at):
+        at = parse_timestamp(at)
+        if task.get("start_time") and parse_timestamp(task["start_time"]) > at:
+            return None
+
+        entries = self.history_manager.get_history(task["id"])
+        count = self.history_manager.count_until(task["id"], at)
+        checkpoints = self._task_checkpoints(task, entries)
+
+        # Checkpoints sit every checkpoint_interval events, so the nearest one is a division away.
+        start, _, state = checkpoints[min(count // self.checkpoint_interval, len(checkpoints) - 1)]
+        state = copy.deepcopy(state)
+        for entry in entries[start:count]:
+            apply_event(state, entry)
+        return state
+
+    def project_state_at(self, project, at):
+        # Returns a copy of the project holding only the tasks that existed at `at`.
+        tasks = []
+        for task in project["tasks"]:
+            state = self._task_state_at(task, at)
+            if state is not None:
+                tasks.append(state)
+        self._save_checkpoints()
+        return {
+            "id": project["id"],
+            "name": project["name"],
+            "owner": project["owner"],
+            "members": list(project["members"]),
+            "tasks": tasks,
+        }
@@ -4,7 +4,42 @@ import uuid
 from datetime import datetime, timedelta
 import re
 import bcrypt
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from main import ProjectManagementSystem , User
+from history import HistoryManager, paginate
+from replay import ReplayEngine
+import analytics
+import replay
+from cdc import ChangeFeed, Replica
+from cache import QueryCache
+from comments import CommentStore
+import loadtest
+
+
+def append_history_events(feed_file, worker, count):
+    # Runs in a separate process for TestChangeFeed.
+    feed = ChangeFeed(feed_file)
+    for i in range(count):
+        feed.record_history(f"t{worker}", {"user": f"w{worker}", "action": str(i)})
+
+
+def add_history_entries(history_file, feed_file, worker, count):
+    # Runs in a separate process for TestHistoryManager.
+    history_manager = HistoryManager(history_file, change_feed=ChangeFeed(feed_file))
+    for i in range(count):
+        history_manager.add_history(f"t{worker}", f"w{worker}", str(i))
+
+
+def add_comments(comments_dir, feed_file, worker, count):
+    # Runs in a separate process for TestCommentStore.
+    store = CommentStore(comments_dir, change_feed=ChangeFeed(feed_file))
+    for i in range(count):
+        store.add("t1", f"w{worker}", f"comment {i}")
 
 
 class TestProjectManagementSystem(unittest.TestCase):
@@ -61,6 +96,38 @@ class TestProjectManagementSystem(unittest.TestCase):
         self.assertEqual(project["tasks"][0]["id"], '12345678-1234-5678-1234-567812345678')
         mock_save_data.assert_called_once()
 
+    @patch('builtins.input', side_effect=['done'])
+    @patch.object(ProjectManagementSystem, 'save_data')
+    def test_change_status_records_only_its_edit(self, mock_save_data, mock_input):
+        pms = ProjectManagementSystem()
+        pms.history_manager = MagicMock()
+        user = MagicMock(username='owner')
+        task = {"id": "t1", "title": "Task", "status": "TODO", "assignees": []}
+        project = {"id": "p1", "name": "Test Project", "owner": "owner", "members": ["owner"], "tasks": [task]}
+        pms.data = {"users": [{"username": "owner"}], "projects": [project]}
+
+        pms.change_status(user, project, task)
+
+        mock_save_data.assert_called_once_with(
+            pms.data, [("task", "t1", {"project_id": "p1"}, "update", {"status": "TODO"}, {"status": "DONE"})])
+
+    def test_save_data_keeps_other_sessions_edits(self):
+        with tempfile.TemporaryDirectory() as directory, patch('main.change_feed', ChangeFeed(os.path.join(directory, 'changes.jsonl'))) as feed:
+            cwd = os.getcwd()
+            os.chdir(directory)
+            try:
+                stale = {"users": [{"username": "ali"}], "projects": []}
+                with open('data.json', 'w') as file:
+                    json.dump({"users": [{"username": "ali"}, {"username": "reza"}], "projects": []}, file)
+                project = {"id": "p1", "name": "P", "owner": "ali", "members": ["ali"], "tasks": []}
+                stale["projects"].append(project)
+                ProjectManagementSystem.save_data(stale, [("project", "p1", None, "insert", None, project)])
+                expected = {"users": [{"username": "ali"}, {"username": "reza"}], "projects": [project]}
+                self.assertEqual(ProjectManagementSystem.load_data(), expected)
+                self.assertEqual(stale, expected)
+            finally:
+                os.chdir(cwd)
+            self.assertEqual([(event["op"], event["id"]) for event in feed.events_since(0)], [("insert", "p1")])
 
 class TestUser(unittest.TestCase):
 
@@ -91,5 +158,471 @@ class TestUser(unittest.TestCase):
         self.assertIsNone(user)
 
 
+class TestHistoryManager(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.history_file = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        history = {
+            "task-a": [
+                {"user": "ali", "action": "Changed status to TODO", "timestamp": "2024-05-01T10:00:00"},
+                {"user": "sara", "action": "Changed status to DOING", "timestamp": "2024-05-03T10:00:00"},
+                {"user": "ali", "action": "Changed status to DONE", "timestamp": "2024-05-05T10:00:00"},
+            ],
+            "task-b": [
+                {"user": "sara", "action": "Changed priority to HIGH", "timestamp": "2024-05-02T10:00:00"},
+                {"user": "ali", "action": "Assigned member sara", "timestamp": "2024-05-04T10:00:00"},
+            ],
+        }
+        with open(self.history_file, 'w') as file:
+            json.dump(history, file)
+        self.manager = HistoryManager(self.history_file)
+
+    def tearDown(self):
+        os.remove(self.history_file)
+
+    def test_task_range(self):
+        entries = self.manager.get_task_range("task-a", since="2024-05-02", until="2024-05-05T10:00:00")
+        self.assertEqual([e["action"] for e in entries], ["Changed status to DOING", "Changed status to DONE"])
+
+    def test_user_range(self):
+        rows = self.manager.get_user_range("ali", since="2024-05-02")
+        self.assertEqual([task_id for task_id, _ in rows], ["task-b", "task-a"])
+
+    def test_activity_feed_is_merged_newest_first(self):
+        feed = self.manager.activity_feed(since="2024-05-02")
+        self.assertEqual([e["timestamp"][:10] for _, e in feed],
+                         ["2024-05-05", "2024-05-04", "2024-05-03", "2024-05-02"])
+
+    def test_activity_feed_pagination(self):
+        feed = self.manager.activity_feed(task_ids=["task-a", "task-b"], users=["ali", "sara"], newest_first=False)
+        self.assertEqual([e["timestamp"][:10] for _, e in paginate(feed, 1, 2)], ["2024-05-03", "2024-05-04"])
+
+    def test_add_history_updates_indexes(self):
+        self.manager.get_history("task-a")
+        self.manager.add_history("task-b", "ali", "Changed status to DONE")
+        rows = self.manager.get_user_range("ali", since="2024-05-06")
+        self.assertEqual(rows[0][1]["action"], "Changed status to DONE")
+        self.assertEqual(len(HistoryManager(self.history_file).get_history("task-b")), 3)
+
+    def test_concurrent_writers_keep_file_and_feed_in_step(self):
+        feed_file = self.history_file + '.changes.jsonl'
+        try:
+            with ProcessPoolExecutor(max_workers=4) as pool:
+                for future in [pool.submit(add_history_entries, self.history_file, feed_file, worker, 50) for worker in range(4)]:
+                    future.result()
+            events = ChangeFeed(feed_file).events_since(0)
+            history = HistoryManager(self.history_file)
+            for worker in range(4):
+                self.assertEqual([entry["action"] for entry in history.get_history(f"t{worker}")], [str(i) for i in range(50)])
+                self.assertEqual([event["after"]["action"] for event in events if event["id"] == f"t{worker}"],
+                                 [str(i) for i in range(50)])
+        finally:
+            for path in (feed_file, feed_file + '.lock'):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+class TestReplayEngine(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.history_file = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        start = datetime(2024, 5, 1)
+        actions = ["Changed status to TODO", "Assigned member ali", "Changed priority to HIGH",
+                   "add new comment: looks good", "Changed status to DOING", "Delete member ali",
+                   "Changed status to DONE"]
+        entries = [{"user": "sara", "action": action, "timestamp": (start + timedelta(days=i)).isoformat()}
+                   for i, action in enumerate(actions)]
+        with open(self.history_file, 'w') as file:
+            json.dump({"task-a": entries}, file)
+        self.task = {"id": "task-a", "title": "Task A", "start_time": "2024-04-30T00:00:00"}
+        self.manager = HistoryManager(self.history_file)
+        self.checkpoint_file = os.path.splitext(self.history_file)[0] + '.checkpoints.json'
+
+    def tearDown(self):
+        os.remove(self.history_file)
+        if os.path.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
+
+    def test_task_state_at(self):
+        state = ReplayEngine(self.manager).task_state_at(self.task, "2024-05-04T12:00:00")
+        self.assertEqual(state["status"], "TODO")
+        self.assertEqual(state["priority"], "HIGH")
+        self.assertEqual(state["assignees"], ["ali"])
+        self.assertEqual(state["comments"][0]["comment"], "looks good")
+
+    def test_task_not_created_yet(self):
+        self.assertIsNone(ReplayEngine(self.manager).task_state_at(self.task, "2024-04-01"))
+
+    def test_checkpoints_match_full_replay(self):
+        full = ReplayEngine(self.manager, checkpoint_interval=100)
+        checkpointed = ReplayEngine(self.manager, checkpoint_interval=2)
+        for day in range(1, 9):
+            at = datetime(2024, 5, day, 12)
+            self.assertEqual(checkpointed.task_state_at(self.task, at), full.task_state_at(self.task, at))
+
+    def test_new_engine_starts_from_stored_checkpoints(self):
+        expected = ReplayEngine(self.manager, checkpoint_interval=2).task_state_at(self.task, "2024-05-10")
+        self.assertTrue(os.path.exists(self.checkpoint_file))
+        with patch('replay.apply_event', wraps=replay.apply_event) as apply:
+            state = ReplayEngine(HistoryManager(self.history_file), checkpoint_interval=2).task_state_at(self.task, "2024-05-10")
+        self.assertEqual(state, expected)
+        self.assertEqual(apply.call_count, 1)
+
+    def test_stored_checkpoints_are_dropped_when_history_changes(self):
+        ReplayEngine(self.manager, checkpoint_interval=2).task_state_at(self.task, "2024-05-10")
+        with open(self.history_file, 'w') as file:
+            json.dump({"task-a": [{"user": "sara", "action": f"Changed priority to {priority}", "timestamp": f"2024-05-0{day}T00:00:00"}
+                                  for day, priority in enumerate(["HIGH", "LOW", "MEDIUM", "CRITICAL"], 1)]}, file)
+        state = ReplayEngine(HistoryManager(self.history_file), checkpoint_interval=2).task_state_at(self.task, "2024-05-10")
+        self.assertEqual((state["status"], state["priority"]), ("BACKLOG", "CRITICAL"))
+
+    def test_project_state_at(self):
+        project = {"id": "p", "name": "P", "owner": "sara", "members": ["sara"],
+                   "tasks": [self.task, {"id": "task-b", "title": "Later", "start_time": "2024-06-01T00:00:00"}]}
+        snapshot = ReplayEngine(self.manager).project_state_at(project, "2024-05-10")
+        self.assertEqual([task["title"] for task in snapshot["tasks"]], ["Task A"])
+        self.assertEqual(snapshot["tasks"][0]["status"], "DONE")
+
+
+class TestFlowAnalytics(unittest.TestCase):
+
+    def setUp(self):
+        def moves(*steps):
+            return [{"user": "ali", "action": f"Changed status to {status}", "timestamp": timestamp}
+                    for status, timestamp in steps]
+
+        self.history = {
+            "t1": moves(("TODO", "2024-05-06T09:00:00"), ("DOING", "2024-05-06T19:00:00"), ("DONE", "2024-05-07T09:00:00")),
+            "t2": moves(("TODO", "2024-05-06T09:00:00"), ("DOING", "2024-05-08T09:00:00"), ("DONE", "2024-05-14T09:00:00")),
+            "t3": moves(("TODO", "2024-05-07T09:00:00")),
+        }
+        self.history["t1"].append({"user": "ali", "action": "add new comment: done", "timestamp": "2024-05-07T10:00:00"})
+        self.projects = [
+            {"id": "p1", "name": "One", "tasks": [{"id": "t1", "assignees": ["ali"]}, {"id": "t3", "assignees": []}]},
+            {"id": "p2", "name": "Two", "tasks": [{"id": "t2", "assignees": ["ali", "sara"]}]},
+        ]
+
+    def test_cycle_time_and_throughput(self):
+        report = analytics.flow_report(self.history, self.projects, workers=1)
+        self.assertEqual(report["tasks"], 3)
+        self.assertEqual(report["completed"], 2)
+        self.assertEqual(report["cycle_time_hours"]["count"], 2)
+        self.assertEqual(report["cycle_time_hours"]["p50"], 108.0)
+        self.assertEqual(report["todo_to_doing_hours"]["mean"], 29.0)
+        self.assertEqual(report["weekly_done"], [{"week": "2024-05-06", "done": 1}, {"week": "2024-05-13", "done": 1}])
+        self.assertEqual(report["by_project"]["One (p1)"]["mean"], 24.0)
+        self.assertEqual(report["by_assignee"]["ali"]["count"], 2)
+        self.assertEqual(report["by_assignee"]["sara"]["mean"], 192.0)
+        self.assertEqual(report["by_task"][1], {"id": "t3", "todo_to_doing_hours": None,
+                                                "doing_to_done_hours": None, "cycle_time_hours": None})
+        json.dumps(report)
+
+    @patch.object(analytics, 'POOL_MIN_EVENTS', 0)
+    def test_process_pool_gives_same_report(self):
+        serial = analytics.flow_report(self.history, self.projects, workers=1)
+        pooled = analytics.flow_report(self.history, self.projects, workers=2)
+        serial.pop("generated_at")
+        pooled.pop("generated_at")
+        self.assertEqual(serial, pooled)
+
+
+class TestChangeFeed(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = lambda name: os.path.join(self.directory.name, name)
+        self.feed = ChangeFeed(self.path('changes.jsonl'))
+        self.data = {"users": [{"username": "ali", "active": True}],
+                     "projects": [{"id": "p1", "name": "One", "owner": "ali", "members": ["ali"], "tasks": []}]}
+        self.write('data.json', self.data)
+        self.write('history.json', {})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, content):
+        with open(self.path(name), 'w') as file:
+            json.dump(content, file)
+
+    def change(self, mutate):
+        before = json.loads(json.dumps(self.data))
+        mutate(self.data)
+        self.write('data.json', self.data)
+        return self.feed.record_data_change(before, self.data)
+
+    def test_events_are_sequenced_and_minimal(self):
+        self.change(lambda d: d["projects"][0]["tasks"].append({"id": "t1", "title": "A", "status": "TODO"}))
+        events = self.change(lambda d: d["projects"][0]["tasks"][0].update(status="DONE"))
+        self.assertEqual(events, [{"seq": 2, "timestamp": events[0]["timestamp"], "entity": "task", "id": "t1",
+                                   "op": "update", "before": {"status": "TODO"}, "after": {"status": "DONE"},
+                                   "project_id": "p1"}])
+        self.assertEqual(ChangeFeed(self.path('changes.jsonl')).last_seq(), 2)
+
+    def test_catch_up_from_sequence_number(self):
+        for i in range(50):
+            self.change(lambda d: d["users"].append({"username": f"user{i}", "active": True}))
+        self.assertEqual([event["seq"] for event in self.feed.events_since(45)], [46, 47, 48, 49, 50])
+        self.assertEqual(self.feed.events_since(50), [])
+        self.assertEqual(len(self.feed.events_since(0)), 50)
+
+    def test_replica_follows_primary(self):
+        replica = Replica(self.path('replica'), self.feed, self.path('data.json'), self.path('history.json'))
+        replica.sync()
+        self.change(lambda d: d["projects"][0]["tasks"].append({"id": "t1", "title": "A", "status": "TODO"}))
+        self.change(lambda d: d["users"][0].pop("active"))
+        self.change(lambda d: d["projects"].append({"id": "p2", "name": "Two", "owner": "ali", "members": [], "tasks": []}))
+        history = HistoryManager(self.path('history.json'), change_feed=self.feed)
+        history.add_history("t1", "ali", "Changed status to DONE")
+        self.assertEqual(replica.lag()["events_behind"], 4)
+
+        self.assertEqual(replica.sync(), 4)
+        self.assertEqual(replica.lag()["events_behind"], 0)
+        with open(self.path('replica/data.json')) as file:
+            self.assertEqual(json.load(file), self.data)
+        with open(self.path('replica/history.json')) as file, open(self.path('history.json')) as primary:
+            replica_history = json.load(file)
+            self.assertEqual(replica_history["t1"][0].pop("seq"), 4)
+            self.assertEqual(replica_history, json.load(primary))
+
+        CommentStore(self.path('comments'), change_feed=self.feed).add("t1", "ali", "hello")
+        self.change(lambda d: d["projects"].pop(0))
+        self.assertEqual(Replica(self.path('replica'), self.feed).sync(), 2)
+        self.assertEqual(CommentStore(self.path('replica/comments')).get("t1", 1)["comment"], "hello")
+        with open(self.path('replica/data.json')) as file:
+            self.assertEqual(json.load(file), self.data)
+
+    def test_only_sync_creates_a_replica(self):
+        replica = Replica(self.path('replica'), self.feed, self.path('data.json'), self.path('history.json'))
+        self.assertFalse(replica.exists())
+        with self.assertRaises(FileNotFoundError):
+            replica.lag()
+        self.assertFalse(os.path.exists(self.path('replica')))
+        replica.sync()
+        self.assertTrue(replica.exists())
+
+    def test_sync_after_a_crash_does_not_repeat_history(self):
+        replica = Replica(self.path('replica'), self.feed, self.path('data.json'), self.path('history.json'))
+        replica.sync()
+        HistoryManager(self.path('history.json'), change_feed=self.feed).add_history("t1", "ali", "Changed status to DONE")
+        with patch.object(Replica, '_save_state', side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                replica.sync()
+
+        self.assertEqual(Replica(self.path('replica'), self.feed).sync(), 1)
+        with open(self.path('replica/history.json')) as file:
+            self.assertEqual([entry["seq"] for entry in json.load(file)["t1"]], [1])
+
+    def test_bootstrap_waits_for_a_write_in_progress(self):
+        entry = {"user": "ali", "action": "Changed status to DONE", "timestamp": "2024-05-01T10:00:00", "ts": 1714557600.0}
+        written = threading.Event()
+
+        def write_history():
+            with self.feed.lock():
+                self.write('history.json', {"t1": [entry]})
+                written.set()
+                time.sleep(0.2)
+                self.feed.record_history("t1", entry)
+
+        writer = threading.Thread(target=write_history)
+        writer.start()
+        written.wait()
+        replica = Replica(self.path('replica'), ChangeFeed(self.path('changes.jsonl')),
+                          self.path('data.json'), self.path('history.json'))
+        replica.bootstrap()
+        writer.join()
+
+        self.assertEqual(replica.sync(), 0)
+        with open(self.path('replica/history.json')) as file:
+            self.assertEqual(json.load(file), {"t1": [entry]})
+
+    def test_concurrent_writers_get_unique_sequence_numbers(self):
+        with ProcessPoolExecutor(max_workers=4) as pool:
+            for future in [pool.submit(append_history_events, self.feed.feed_file, worker, 200) for worker in range(4)]:
+                future.result()
+        events = self.feed.events_since(0)
+        self.assertEqual([event["seq"] for event in events], list(range(1, 801)))
+        self.assertEqual(self.feed.last_seq(), 800)
+        for worker in range(4):
+            actions = [event["after"]["action"] for event in events if event["id"] == f"t{worker}"]
+            self.assertEqual(actions, [str(i) for i in range(200)])
+
+
+class TestQueryCache(unittest.TestCase):
+
+    def test_version_bump_invalidates(self):
+        cache = QueryCache()
+        build = MagicMock(side_effect=[("a", 1), ("b", 1)])
+        self.assertEqual(cache.fetch(("tasks", None, "p1", 0, 80), ["p1"], build), "a")
+        self.assertEqual(cache.fetch(("tasks", None, "p1", 0, 80), ["p1"], build), "a")
+        cache.bump("p2")
+        self.assertEqual(cache.fetch(("tasks", None, "p1", 0, 80), ["p1"], build), "a")
+        cache.bump("p1")
+        self.assertEqual(cache.fetch(("tasks", None, "p1", 0, 80), ["p1"], build), "b")
+        self.assertEqual(cache.stats()["hits"], 2)
+        self.assertEqual(cache.stats()["misses"], 2)
+
+    def test_lru_eviction_respects_memory_cap(self):
+        cache = QueryCache(max_bytes=100)
+        cache.fetch("a", [], lambda: ("a", 40))
+        cache.fetch("b", [], lambda: ("b", 40))
+        cache.fetch("a", [], lambda: ("a2", 40))
+        cache.fetch("c", [], lambda: ("c", 40))
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertEqual(cache.stats()["bytes"], 80)
+        self.assertEqual(cache.fetch("a", [], lambda: ("a3", 40)), "a")
+        self.assertEqual(cache.fetch("b", [], lambda: ("b2", 40)), "b2")
+
+    @patch('builtins.input', side_effect=['back', 'back', 'DONE', 'back'])
+    @patch('main.cls')
+    @patch.object(ProjectManagementSystem, 'save_data')
+    def test_task_list_is_served_from_cache_until_changed(self, mock_save_data, mock_cls, mock_input):
+        pms = ProjectManagementSystem()
+        pms.history_manager = MagicMock()
+        user = MagicMock(username='owner')
+        task = {"id": "t1", "title": "Task", "status": "TODO", "priority": "LOW", "start_time": "s",
+                "end_time": "e", "assignees": [], "comments": []}
+        project = {"id": "p1", "name": "Test Project", "owner": "owner", "members": ["owner"], "tasks": [task]}
+        pms.data = {"users": [{"username": "owner"}], "projects": [project]}
+
+        with patch.object(pms, 'build_task_list', wraps=pms.build_task_list) as build:
+            pms.list_tasks(user, project)
+            pms.list_tasks(user, project)
+            self.assertEqual(build.call_count, 1)
+            pms.change_status(user, project, task)
+            pms.list_tasks(user, project)
+            self.assertEqual(build.call_count, 2)
+
+    @patch('builtins.input', side_effect=['', 'b', '', 'b'])
+    @patch('main.cls')
+    @patch.object(ProjectManagementSystem, 'save_data')
+    def test_activity_page_is_rebuilt_after_project_deleted(self, mock_save_data, mock_cls, mock_input):
+        pms = ProjectManagementSystem()
+        pms.history_manager = MagicMock()
+        pms.history_manager.version.return_value = (1, 1)
+        pms.history_manager.activity_feed.side_effect = lambda **kwargs: iter(
+            [("t1", {"timestamp": "2024-05-01T10:00:00", "user": "owner", "action": "Changed status to DONE"})])
+        user = MagicMock(username='owner')
+        project = {"id": "p1", "name": "Test Project", "owner": "owner", "members": ["owner"],
+                   "tasks": [{"id": "t1", "title": "Task"}]}
+        pms.data = {"users": [{"username": "owner"}], "projects": [project]}
+
+        with patch.object(pms, 'build_activity_page', wraps=pms.build_activity_page) as build:
+            pms.user_activity(user)
+            pms.delete_project(user, project)
+            pms.user_activity(user)
+            self.assertEqual(build.call_count, 2)
+        self.assertEqual(pms.task_titles(), {})
+
+
+class TestCommentStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = CommentStore(os.path.join(self.directory.name, 'comments'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_pages_are_newest_first(self):
+        for i in range(1, 26):
+            self.store.add("t1", "ali", f"comment {i}")
+        self.assertEqual(self.store.count("t1"), 25)
+        self.assertEqual([c["id"] for c in self.store.page("t1", 0, 10)], list(range(25, 15, -1)))
+        self.assertEqual([c["id"] for c in self.store.page("t1", 2, 10)], [5, 4, 3, 2, 1])
+        self.assertEqual(self.store.page("t1", 3, 10), [])
+        self.assertEqual(self.store.get("t1", 7)["comment"], "comment 7")
+        self.assertEqual(self.store.page("t2"), [])
+
+    def test_concurrent_adds_get_unique_ids(self):
+        feed_file = os.path.join(self.directory.name, 'changes.jsonl')
+        with ProcessPoolExecutor(max_workers=4) as pool:
+            for future in [pool.submit(add_comments, self.store.comments_dir, feed_file, worker, 100) for worker in range(4)]:
+                future.result()
+        self.assertEqual(self.store.count("t1"), 400)
+        self.assertEqual([self.store.get("t1", i)["id"] for i in range(1, 401)], list(range(1, 401)))
+        self.assertEqual([event["id"] for event in ChangeFeed(feed_file).events_since(0)], list(range(1, 401)))
+
+    def test_migrate_inline_comments(self):
+        task = {"id": "t1", "comments": [{"username": "ali", "comment": "old", "timestamp": "2024-05-01T10:00:00"}]}
+        stale = json.loads(json.dumps(task))
+        self.assertTrue(self.store.migrate(task))
+        self.assertNotIn("comments", task)
+        self.assertEqual(task["comment_count"], 1)
+        self.assertEqual(self.store.get("t1", 1)["comment"], "old")
+        self.assertFalse(self.store.migrate(task))
+        self.assertTrue(self.store.migrate(stale))
+        self.assertEqual(self.store.count("t1"), 1)
+
+    def test_migrate_records_feed_events(self):
+        feed = ChangeFeed(os.path.join(self.directory.name, 'changes.jsonl'))
+        store = CommentStore(self.store.comments_dir, change_feed=feed)
+        task = {"id": "t1", "comments": [{"username": "ali", "comment": "a", "timestamp": "2024-05-01T10:00:00"},
+                                         {"username": "reza", "comment": "b", "timestamp": "2024-05-02T10:00:00"}]}
+        store.migrate(task)
+        self.assertEqual([(event["entity"], event["task_id"], event["after"]["comment"]) for event in feed.events_since(0)],
+                         [("comment", "t1", "a"), ("comment", "t1", "b")])
+
+    @patch('builtins.input', side_effect=['b'])
+    @patch('main.cls')
+    @patch.object(ProjectManagementSystem, 'save_data')
+    def test_view_comments_shows_inline_comments_without_migrating(self, mock_save_data, mock_cls, mock_input):
+        pms = ProjectManagementSystem()
+        pms.comment_store = self.store
+        task = {"id": "t1", "title": "Task", "comments": [{"username": "ali", "comment": "old", "timestamp": "t"},
+                                                          {"username": "ali", "comment": "new", "timestamp": "t"}]}
+
+        pms.view_comments(task)
+
+        mock_save_data.assert_not_called()
+        self.assertEqual(self.store.count("t1"), 0)
+        self.assertEqual([comment["id"] for comment in pms.comment_page(task, 0)], [2, 1])
+
+    @patch('builtins.input', side_effect=['first!'])
+    @patch.object(ProjectManagementSystem, 'save_data')
+    def test_add_comment_keeps_body_out_of_task(self, mock_save_data, mock_input):
+        pms = ProjectManagementSystem()
+        pms.comment_store = self.store
+        pms.history_manager = MagicMock()
+        user = MagicMock(username='ali')
+        task = {"id": "t1", "title": "Task", "assignees": [], "comment_count": 0, "comments_ref": self.store.pointer("t1")}
+        project = {"id": "p1", "name": "P", "owner": "ali", "members": ["ali"], "tasks": [task]}
+
+        pms.add_comment(user, project, task)
+
+        self.assertEqual(task["comment_count"], 1)
+        self.assertNotIn("first!", json.dumps(task))
+        pms.history_manager.add_history.assert_called_once_with("t1", "ali", "add new comment #1")
+        self.assertEqual(self.store.page("t1")[0]["comment"], "first!")
+
+
+class TestLoadTest(unittest.TestCase):
+
+    def test_parse_mix(self):
+        self.assertEqual(loadtest.parse_mix("list_tasks=5,add_comment"), {"list_tasks": 5.0, "add_comment": 1.0})
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix("delete_everything=1")
+
+    def test_integrity_check(self):
+        with tempfile.TemporaryDirectory() as store:
+            data = {"users": [{"username": "w0-user1"}],
+                    "projects": [{"id": "p1", "owner": "w0-user1", "tasks": [{"id": "t1", "status": "TODO"}]}]}
+            with open(os.path.join(store, 'data.json'), 'w') as file:
+                json.dump(data, file)
+            with open(os.path.join(store, 'history.json'), 'w') as file:
+                file.write('{"t1": [')
+            expected = {"users": ["w0-user1", "w1-user1"], "projects": ["p1"], "tasks": {"t1": "p1", "t2": "p1"},
+                        "status": {"t1": "DONE"}, "history": {"t1": 1}, "comments": {}}
+
+            report = loadtest.check_integrity(store, [{"expected": expected}])
+
+        self.assertEqual(len(report["corrupt_files"]), 1)
+        self.assertEqual(report["lost_users"], ["w1-user1"])
+        self.assertEqual(report["lost_tasks"], ["t2"])
+        self.assertEqual(report["lost_status_updates"], ["t1"])
+        self.assertEqual(report["lost_history_entries"], 1)
+
+
 if __name__ == '__main__':
     unittest.main()